@@ -0,0 +1,97 @@
+"""
+當機復原檢查
+每個階段開一個新的process模擬一次開啟程式，在暫存資料夾中操作，不影響目前的自動存檔
+依序模擬: 開啟演出後正常關閉 -> 從空白開始沒有修改，自動存檔一次後正常關閉 (自動存檔不應被蓋掉)
+          -> 從空白開始新增工作人員後當機 -> 重新開啟復原
+          -> 修改細流後當機 -> 重新開啟復原，比對復原的資料與當機前是否相同
+用法: python bench/recovery.py
+有不同時回傳錯誤碼1
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(BENCH, '..', 'src')
+
+
+def child(step):
+    """在子process中啟動主程式並執行step，印出當時的存檔資料"""
+    sys.path.insert(0, SRC)
+    sys.path.insert(0, BENCH)
+    from PyQt5.QtWidgets import QApplication
+    import main
+    from synthetic import make_show
+
+    app = QApplication(sys.argv)
+    window = main.launch()
+    app.processEvents() # 執行Controller.start，沒有正常關閉時在此復原
+    controller = window.controller
+
+    if step == 'open': # 開啟演出後正常關閉
+        controller.load_state(make_show(10, 30, seed=0))
+        controller.record('load', state=controller.state())
+    elif step == 'idle': # 沒有修改，自動存檔應該略過
+        controller.auto_save()
+    elif step == 'add': # 從空白開始新增一位工作人員
+        name = '新人員'
+        controller.staff_dic[name] = {"jobs": 0, "priority": '中', "performances": [], "assistances": [],
+                                      'extinguish': '可', 'num': controller.unique_id}
+        controller.unique_id += 1
+        controller.record_staff(name)
+        controller.invalidate()
+    elif step == 'cell': # 修改細流的一格並鎖定
+        controller.job_arr = [['' for _ in range(10)] for _ in range(2)]
+        controller.record('job_arr', job_arr=controller.job_arr, pinned=[])
+        controller.job_arr[1][2] = '新人員'
+        controller.record('cell', row=1, col=2, name='新人員')
+        controller.pinned.add((1, 2))
+        controller.record('pin', row=1, col=2, pinned=True)
+
+    app.processEvents()
+    print(json.dumps(controller.state(), ensure_ascii=False))
+    sys.stdout.flush()
+    if step in ('open', 'idle'):
+        window.close()
+    else: # 模擬當機，不執行關閉時的處理
+        os._exit(0)
+
+
+def run(step, cwd):
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', step],
+                         capture_output=True, text=True, env=env, cwd=cwd, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--child':
+        child(sys.argv[2])
+        return
+
+    failed = False
+    with tempfile.TemporaryDirectory() as cwd:
+        opened = run('open', cwd)
+        run('idle', cwd)
+        with open(os.path.join(cwd, 'auto_save.json'), encoding='utf-8') as f:
+            saved = json.load(f)
+        saved.pop('version')
+        ok = saved == opened
+        failed = not ok
+        print(f"idle: {'沒有修改，自動存檔保留' if ok else '自動存檔被蓋掉'}")
+        for step in ('add', 'cell'):
+            before = run(step, cwd)
+            after = run('recover', cwd)
+            ok = before == after
+            failed = failed or not ok
+            print(f"{step}: {'復原成功' if ok else '復原結果不同'} (工作人員 {len(after['staff_dic'])}，"
+                  f"表演 {len(after['first_half']) + len(after['second_half'])})")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+啟動時間測試
+量測冷啟動 (開啟python) 到主視窗第一次繪製的時間，每次都開新的process
+用法: python bench/startup.py [--runs 5] [--budget 毫秒]
+超過budget時回傳錯誤碼1，可用於檢查啟動時間是否變慢
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+
+def child():
+    """在子process中啟動主程式，第一次繪製時印出時間並結束"""
+    sys.path.insert(0, SRC)
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QObject, QEvent, QTimer
+    imported = time.time()
+
+    class FirstPaint(QObject):
+        def __init__(self):
+            super().__init__()
+            self.painted = None
+            self.modules = []
+
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and self.painted is None:
+                self.painted = time.time()
+                self.modules = sorted(m for m in ('numpy', 'openpyxl', 'sqlite3') if m in sys.modules)
+                QTimer.singleShot(0, app.quit)
+            return False
+
+    app = QApplication(sys.argv)
+    first_paint = FirstPaint()
+    app.installEventFilter(first_paint)
+    import main
+    window = main.launch()
+    app.exec_()
+    print(json.dumps({'qt': imported, 'paint': first_paint.painted, 'modules': first_paint.modules}))
+
+
+def measure():
+    """啟動一次，回傳各階段距離啟動的毫秒數"""
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    with tempfile.TemporaryDirectory() as cwd: # 不讀取目前資料夾的自動存檔，每次都從空白開始
+        start = time.time()
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'],
+                             capture_output=True, text=True, env=env, cwd=cwd, check=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    return {'qt_ms': (result['qt'] - start) * 1000, 'first_paint_ms': (result['paint'] - start) * 1000,
+            'modules': result['modules']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='量測冷啟動到第一次繪製的時間')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=None, help='第一次繪製時間的上限 (毫秒，取中位數比較)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    runs = [measure() for _ in range(args.runs)]
+    paint = [r['first_paint_ms'] for r in runs]
+    median = statistics.median(paint)
+    print(f"Qt載入完成: {statistics.median(r['qt_ms'] for r in runs):.0f} ms")
+    print(f"第一次繪製: 中位數 {median:.0f} ms (最快 {min(paint):.0f} ms, 最慢 {max(paint):.0f} ms, {args.runs} 次)")
+    print(f"第一次繪製前已載入: {', '.join(runs[-1]['modules']) or '無'}")
+    if args.budget is not None and median > args.budget:
+        print(f"超過啟動時間上限 {args.budget:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+效能測試
+以synthetic.py產生不同規模的演出，在offscreen Qt下量測生成細流、表格重新整理、自動檢查、存檔及讀檔
+結果存成json，給定baseline時比較最快的一次 (受其他程式干擾最少)，變慢超過threshold的項目列為退步並回傳錯誤碼1
+用法: python bench/suite.py [--sizes 10x30,40x150,100x500] [--repeat 5] [--baseline bench/baseline.json]
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH, '..', 'src'))
+
+from PyQt5.QtWidgets import QApplication, QFileDialog, QMessageBox
+from synthetic import make_show
+
+SIZES = '10x30,40x150,100x500'
+MIN_DIFF_MS = 2.0 # 差距小於此值時視為誤差，不列為退步
+
+
+def timed(func, repeat, setup=None):
+    """先執行一次暖機，再量測repeat次，回傳毫秒數的統計"""
+    times = []
+    for i in range(repeat + 1):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        if i:
+            times.append(elapsed)
+    return {'median_ms': statistics.median(times), 'min_ms': min(times), 'max_ms': max(times)}
+
+
+def run_size(app, acts, staff, repeat, seed, workdir):
+    import main
+    window = main.MainWindow()
+    controller = window.controller
+    flow_table = window.middle_table
+    staff_table = window.right_table
+    window.show() # 量測包含重畫
+    data = make_show(acts, staff, seed)
+    controller.load_state(copy.deepcopy(data))
+    app.processEvents()
+
+    def flow_update():
+        flow_table.update()
+        app.processEvents()
+
+    def staff_update():
+        staff_table.update()
+        app.processEvents()
+
+    def generate():
+        flow_table.generate()
+        flow_table.generator.wait() # 生成在背景執行緒進行
+        app.processEvents() # 包含套用結果及之後排程的表格重新整理
+
+    def clear_index():
+        controller.get_arranger().issues = None # 每次都重建衝突索引
+
+    file_path = os.path.join(workdir, f'{acts}x{staff}.json')
+    QFileDialog.getSaveFileName = staticmethod(lambda *args: (file_path, ''))
+    QFileDialog.getOpenFileName = staticmethod(lambda *args: (file_path, ''))
+
+    def save():
+        controller.save_file('save as')
+
+    def load():
+        controller.read_file()
+        app.processEvents()
+
+    results = {
+        'generate': timed(generate, repeat),
+        'flow_update': timed(flow_update, repeat),
+        'staff_update': timed(staff_update, repeat),
+        'check': timed(flow_table.check, repeat, clear_index),
+        'save': timed(save, repeat),
+        'load': timed(load, repeat),
+    }
+    results['file_kb'] = os.path.getsize(file_path) / 1024
+    controller.close()
+    window.hide()
+    window.deleteLater()
+    app.processEvents()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """回傳變慢超過threshold的項目 [(規模, 項目, baseline毫秒, 目前毫秒)]"""
+    regressions = []
+    for size, ops in results['results'].items():
+        for op, stats in ops.items():
+            old = baseline.get('results', {}).get(size, {}).get(op)
+            if not isinstance(stats, dict) or not old:
+                continue
+            new_ms, old_ms = stats['min_ms'], old['min_ms']
+            if new_ms > old_ms * (1 + threshold) and new_ms - old_ms > MIN_DIFF_MS:
+                regressions.append((size, op, old_ms, new_ms))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='細流編輯器效能測試')
+    parser.add_argument('--sizes', default=SIZES, help='表演數x工作人員數，以逗號分隔')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join(BENCH, 'results.json'))
+    parser.add_argument('--baseline', default=None, help='比較用的結果檔，例如 bench/baseline.json')
+    parser.add_argument('--threshold', type=float, default=0.3, help='最快一次變慢超過此比例時列為退步')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    QMessageBox.exec_ = lambda self: QMessageBox.Ok # 自動檢查的結果視窗不等待使用者
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': {},
+    }
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir) # 自動存檔及編輯紀錄寫在暫存資料夾
+        try:
+            for size in args.sizes.split(','):
+                acts, staff = map(int, size.split('x'))
+                results['results'][size] = run_size(app, acts, staff, args.repeat, args.seed, workdir)
+                line = ', '.join(f"{op} {s['median_ms']:.1f}" for op, s in results['results'][size].items() if isinstance(s, dict))
+                print(f"{size}: {line} (ms)")
+        finally:
+            os.chdir(cwd)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=4)
+    print(f"結果已存到 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for size, op, old_ms, new_ms in regressions:
+            print(f"退步: {size} {op} {old_ms:.1f} ms -> {new_ms:.1f} ms")
+        if regressions:
+            sys.exit(1)
+        print('沒有退步')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+產生測試用的演出資料
+同樣的seed一定產生同樣的表演及工作人員，不同規模的結果可以互相比較
+"""
+import random
+
+PRIORITIES = ['高', '中', '中', '低'] # 中優先度的人較多
+EXTINGUISH = ['可', '可', '不可']
+
+
+def make_show(acts, staff, seed=0):
+    """
+    產生acts個表演、staff位工作人員的演出，格式與存檔相同
+    每個表演有2~6位表演者及0~2位場協，只有參與表演或場協的人會列入工作人員
+    """
+    rnd = random.Random(seed)
+    names = [f"人員{i:03d}" for i in range(staff)]
+    first_half, second_half = {}, {}
+    for k in range(acts):
+        half = first_half if k < acts // 2 else second_half
+        performers = rnd.sample(names, rnd.randint(2, 6))
+        rest = [n for n in names if n not in performers]
+        assistants = rnd.sample(rest, rnd.randint(0, 2))
+        half[f"表演{k:03d}"] = {'performers': performers, 'assistants': assistants, 'time': rnd.choice([3, 4, 5, 6])}
+
+    staff_dic = {}
+    for p_name, p in list(first_half.items()) + list(second_half.items()):
+        for name in p['performers'] + p['assistants']:
+            if name not in staff_dic:
+                staff_dic[name] = {"jobs": 0, "priority": rnd.choice(PRIORITIES), "performances": [], "assistances": [],
+                                   'extinguish': rnd.choice(EXTINGUISH), 'num': len(staff_dic)}
+        for name in p['performers']:
+            staff_dic[name]['performances'].append(p_name)
+        for name in p['assistants']:
+            staff_dic[name]['assistances'].append(p_name)
+
+    return {
+        'schema': 2,
+        "first_half": first_half,
+        "second_half": second_half,
+        "staff_dic": staff_dic,
+        "job_arr": [[]],
+        "pinned": [],
+        'unique_id': len(staff_dic)
+    }
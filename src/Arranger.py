@@ -0,0 +1,593 @@
+"""
+細流排班引擎
+不依賴Qt，輸入上下半場表演及工作人員資料，輸出job_arr
+人員空閒程度以 人員 x 時段 的numpy矩陣保存，時段即為job_arr的row
+"""
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import Stats
+
+COLS = 10 # 每個時段的工作數量，對應細流的 闈場1~6、左火區1~2、右火區1~2
+FIRE_COLS = (6, 8) # 左火區1、右火區1 需要有火區許可的人
+LIMITS = {'高': 6, '中': 4, '低': 2, '無': 0}
+
+# 空閒程度，數字越大越空閒
+BUSY = 0 # 表演、場協、表演者的預熱
+WORKING = 1 # 已排入工作
+PREPARE = 3 # 準備一、準備二
+REST = 7 # 表演完下一場
+FREE = 10 # 空閒
+
+# 細流扣分，越小越好，工作分配不平均以每人工作數的平方和計算
+PENALTY_EMPTY = 100 # 每個空格
+PENALTY_FIRE = 100 # 火區空格額外扣分
+PENALTY_SOFT = {PREPARE: 60, REST: 40} # 排在準備、剛下場時段的工作，只有局部優化會這樣排
+NOISE = 3 * FREE # 隨機排班時表演權重的擾動幅度，約為三個人的空閒程度
+
+# 自動檢查的衝突種類，依顯示順序排列
+CONFLICTS = ['表演', '準備1', '準備2', '表演完下一場', '場協', '場協準備1', '連續三場工作']
+# 排班時刷掉候選人的規則，依檢查順序排列，每個人只算在第一條不符合的規則
+REJECTIONS = ['工作上限', '沒有空', '連續工作', '火區許可']
+
+
+def perf_rows(first_half, second_half):
+    """表演名稱 -> job_arr中的row"""
+    rows = {}
+    for i, name in enumerate(first_half.keys()):
+        rows[name] = i + 1
+    for i, name in enumerate(second_half.keys()):
+        rows[name] = len(first_half) + 2 + i
+    return rows
+
+
+class StaffQueue:
+    """
+    依工作數量分桶的人員佇列
+    人員得到工作時直接搬到對應的桶，不需要每次重新排序
+    同一個桶內依名單順序取出，有給order時改依order的順序取出
+    """
+    def __init__(self, jobs, levels, order=None):
+        self.jobs = jobs
+        self.order = order
+        self.bucket = np.zeros((levels + 1, len(jobs)), dtype=bool)
+        self.bucket[jobs, np.arange(len(jobs))] = True
+
+    def add(self, i, n):
+        """第i個人的工作數量增加n"""
+        old = self.jobs[i]
+        new = old + n
+        if new >= len(self.bucket):
+            self.bucket = np.vstack([self.bucket, np.zeros((new + 1 - len(self.bucket), self.bucket.shape[1]), dtype=bool)])
+        self.bucket[old, i] = False
+        self.bucket[new, i] = True
+        self.jobs[i] = new
+
+    def candidates(self, mask):
+        """依工作數量由少到多，逐一取出mask中的人員"""
+        mask = mask.copy()
+        for level in self.bucket:
+            hit = mask & level
+            if self.order is None:
+                ids = np.flatnonzero(hit)
+            else:
+                ids = self.order[np.flatnonzero(hit[self.order])]
+            for i in ids:
+                mask[i] = False # 取出後工作數量會變，避免在下一個桶重複取出
+                yield i
+
+
+class Arranger:
+    def __init__(self, first_half, second_half, staff_dic, job_arr=None, seed=None, pins=None):
+        self.first_half = first_half
+        self.second_half = second_half
+        self.F = len(first_half)
+        self.S = len(second_half)
+        self.max_row = self.F + self.S + 2
+
+        self.perf_row = perf_rows(first_half, second_half)
+
+        self.names = list(staff_dic.keys())
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.limit = np.array([LIMITS.get(s['priority'], 0) for s in staff_dic.values()], dtype=np.int32)
+        self.fire_ok = np.array([s['extinguish'] != '不可' for s in staff_dic.values()], dtype=bool)
+
+        self.perform = np.zeros((len(self.names), self.max_row), dtype=bool) # 人員在該時段表演
+        self.assist = np.zeros((len(self.names), self.max_row), dtype=bool) # 人員在該時段場協
+        self.base = self.base_availability(staff_dic)
+        self.weight = self.base.sum(axis=0, dtype=np.int64) # 越小代表越少人有空，越先排
+
+        self.avail = self.base.copy()
+        self.jobs = np.zeros(len(self.names), dtype=np.int32)
+        # 有給seed時打亂同分人員的順序及表演的排班順序
+        self.rng = np.random.default_rng(seed) if seed is not None else None
+        order = self.rng.permutation(len(self.names)) if self.rng is not None else None
+        self.queue = StaffQueue(self.jobs, int(self.limit.max(initial=0)), order)
+        self.arr = [["" for _ in range(COLS)] for _ in range(self.max_row)]
+        # 人員 x 時段 的工作數，排班、自動檢查及手動修改都以此判斷連續工作及衝突
+        self.assigned = np.zeros((len(self.names), self.max_row), dtype=np.uint8)
+        self.issues = None # 衝突索引 {(row, col): [衝突種類]}，第一次使用時建立，之後隨手動修改更新
+        # 時段 x REJECTIONS 被刷掉的候選人數，自動排班時累計，用來說明空格的原因
+        self.rejects = [[0] * len(REJECTIONS) for _ in range(self.max_row)]
+        self.screened = False # 是否有自動排班過，只載入細流時沒有統計
+        self.optimal = None # 最佳化模式是否在時間內證明填滿最多格，其他模式為None
+        if job_arr:
+            self.load(job_arr)
+        # 鎖定的格子 (row, col)，排班時視為固定，只填其他格子
+        self.pinned = set()
+        for (row, col), name in (pins or {}).items():
+            if row < self.max_row and col < COLS and name:
+                self.set_cell(row, col, name)
+                self.pinned.add((row, col))
+
+    def segment(self, row):
+        """回傳row所在半場的 (預熱row, 第一場row, 最後一場row)"""
+        if row <= self.F:
+            return 0, 1, self.F
+        return self.F + 1, self.F + 2, self.max_row - 1
+
+    def base_availability(self, staff_dic):
+        """根據表演及場協計算人員的空閒程度，同一格有多個限制時取最嚴格者"""
+        base = np.full((len(self.names), self.max_row), FREE, dtype=np.int8)
+        ii, rr, cc = [], [], []
+        for i, staff in enumerate(staff_dic.values()):
+            for p in staff['performances']:
+                if p not in self.perf_row:
+                    continue
+                row = self.perf_row[p]
+                warm, _, last = self.segment(row)
+                self.perform[i, row] = True
+                ii += [i, i]
+                rr += [warm, row] # 禁止預熱闈場、禁止該表演
+                cc += [BUSY, BUSY]
+                for r in (row - 1, row - 2): # 降低準備一、準備二
+                    if r > warm:
+                        ii.append(i)
+                        rr.append(r)
+                        cc.append(PREPARE)
+                if row + 1 <= last: # 降低下一場
+                    ii.append(i)
+                    rr.append(row + 1)
+                    cc.append(REST)
+            for p in staff['assistances']:
+                if p not in self.perf_row:
+                    continue
+                row = self.perf_row[p]
+                warm, _, _ = self.segment(row)
+                self.assist[i, row] = True
+                ii.append(i)
+                rr.append(row)
+                cc.append(BUSY)
+                if row - 1 > warm: # 降低準備一
+                    ii.append(i)
+                    rr.append(row - 1)
+                    cc.append(PREPARE)
+        if ii:
+            np.minimum.at(base, (np.array(ii), np.array(rr)), np.array(cc, dtype=np.int8))
+        return base
+
+    def working(self, row):
+        """回傳在row有工作的人員mask"""
+        return self.assigned[:, row] > 0
+
+    def assign(self, i, row, col):
+        self.arr[row][col] = self.names[i]
+        self.assigned[i, row] += 1
+        self.avail[i, row] = WORKING
+        self.queue.add(i, 1)
+
+    def unassign(self, row, col):
+        name = self.arr[row][col]
+        self.arr[row][col] = ""
+        if name not in self.index:
+            return
+        i = self.index[name]
+        self.assigned[i, row] -= 1
+        self.queue.add(i, -1)
+        if not self.assigned[i, row]:
+            self.avail[i, row] = self.base[i, row]
+
+    def set_cell(self, row, col, name):
+        """
+        手動修改單一格，name為空字串時清除該格
+        回傳衝突狀態可能改變的格子 [(row, col)]
+        """
+        prev = self.arr[row][col]
+        if prev == name:
+            return []
+        if prev:
+            self.unassign(row, col)
+        if name in self.index:
+            self.assign(self.index[name], row, col)
+        else:
+            self.arr[row][col] = name # 不在名單中的人，只保留文字
+        if self.issues is None:
+            return []
+        self.issues.pop((row, col), None)
+        return [(row, col)] + self.recheck(prev, row) + self.recheck(name, row)
+
+    def recheck(self, name, row):
+        """重新計算name在row前後兩場內的衝突，回傳重新計算的格子"""
+        if name not in self.index:
+            return []
+        warm, first, last = self.segment(row)
+        rows = [row] if row == warm else range(max(first, row - 2), min(last, row + 2) + 1)
+        touched = []
+        for r in rows:
+            for c, n in enumerate(self.arr[r]):
+                if n == name:
+                    found = self.conflicts(r, name)
+                    if found:
+                        self.issues[(r, c)] = found
+                    else:
+                        self.issues.pop((r, c), None)
+                    touched.append((r, c))
+        return touched
+
+    def conflict_index(self):
+        """回傳衝突索引 {(row, col): [衝突種類]}，沒有衝突的格子不在索引中"""
+        if self.issues is None:
+            self.issues = {}
+            for row, col, name in self.cells():
+                found = self.conflicts(row, name)
+                if found:
+                    self.issues[(row, col)] = found
+        return self.issues
+
+    def pins(self):
+        """回傳鎖定格子的內容 {(row, col): 名字}"""
+        return {(row, col): self.arr[row][col] for row, col in self.pinned}
+
+    def load(self, job_arr):
+        """載入已經存在的細流"""
+        for row, cells in enumerate(job_arr[:self.max_row]):
+            for col, name in enumerate(cells[:COLS]):
+                if name:
+                    self.set_cell(row, col, name)
+
+    def cells(self):
+        """逐一回傳有人的格子 (row, col, name)"""
+        for row, cells in enumerate(self.arr):
+            for col, name in enumerate(cells):
+                if name:
+                    yield row, col, name
+
+    def job_cells(self, i):
+        """第i個人所有工作的 (row, col)，只查看有工作的row"""
+        name = self.names[i]
+        return [(row, col) for row in np.flatnonzero(self.assigned[i]).tolist()
+                for col, n in enumerate(self.arr[row]) if n == name]
+
+    def consecutive(self, i, row):
+        """第i個人加上row的工作後是否連續工作三場以上"""
+        _, first, last = self.segment(row)
+        if row < first:
+            return False
+        w = self.assigned[i]
+        for start in (row - 2, row - 1, row):
+            if start >= first and start + 2 <= last and all(w[r] or r == row for r in range(start, start + 3)):
+                return True
+        return False
+
+    def conflicts(self, row, name):
+        """回傳name在row工作時的所有衝突，種類見CONFLICTS"""
+        if name not in self.index:
+            return []
+        i = self.index[name]
+        _, first, last = self.segment(row)
+        result = []
+        if self.perform[i, row]:
+            result.append('表演')
+        if first <= row < last and self.perform[i, row + 1]:
+            result.append('準備1')
+        if first <= row < last - 1 and self.perform[i, row + 2]:
+            result.append('準備2')
+        if row - 1 >= first and self.perform[i, row - 1]:
+            result.append('表演完下一場')
+        if self.assist[i, row]:
+            result.append('場協')
+        if first <= row < last and self.assist[i, row + 1]:
+            result.append('場協準備1')
+        if self.consecutive(i, row):
+            result.append('連續三場工作')
+        return result
+
+    def fill(self, rows, candidates):
+        """
+        將candidates依序填入rows中所有空的欄位，火區欄位只填入有火區許可的人
+        rows: [list] 同時填入的row，一次塞兩份工作時為兩個row
+        candidates: [iterator] 依優先順序產生的人員編號
+        """
+        self.issues = None # 自動排班後重建衝突索引
+        pending = [] # 已取出但還沒排入的人員 (沒有火區許可)
+        self.fill_cols(rows, candidates, pending)
+        # 火區留空時，最後沒排入的人才算是因為火區許可被刷掉，之後排進一般欄位的不算
+        if pending and any(not self.arr[r][c] for r in rows for c in FIRE_COLS):
+            for r in rows:
+                self.rejects[r][3] += len(pending)
+
+    def fill_cols(self, rows, candidates, pending):
+        """fill的主體，pending中留下沒有排入的人員"""
+        for col in range(COLS):
+            if any(self.arr[r][col] for r in rows):
+                continue
+            fire = col in FIRE_COLS
+            pick = None
+            for k, i in enumerate(pending):
+                if not fire or self.fire_ok[i]:
+                    pick = pending.pop(k)
+                    break
+            while pick is None:
+                i = next(candidates, None)
+                if i is None:
+                    break
+                if fire and not self.fire_ok[i]:
+                    pending.append(i)
+                    continue
+                pick = i
+            if pick is None:
+                if not fire:
+                    return
+                continue
+            for r in rows:
+                self.assign(pick, r, col)
+
+    def screen(self, rows, need, first=None, last=None):
+        """
+        依序套用排班規則，回傳可以排入rows的人員mask，並記錄每條規則在rows刷掉的人數
+        need: [int] 每人要增加的工作數量
+        first, last: [int] 半場的第一場及最後一場，有給時防止連續3+場工作
+        """
+        self.screened = True
+        mask = self.jobs + need <= self.limit # 限制個人工作數量上限
+        total = len(mask)
+        after_limit = int(np.count_nonzero(mask))
+        for r in rows:
+            mask &= self.avail[:, r] == FREE
+        after_avail = int(np.count_nonzero(mask))
+        after_guard = after_avail
+        if first is not None: # 防止連續3+場工作
+            if rows[0] - 1 >= first:
+                mask &= ~self.working(rows[0] - 1)
+            if rows[-1] + 1 <= last:
+                mask &= ~self.working(rows[-1] + 1)
+            after_guard = int(np.count_nonzero(mask))
+        for r in rows:
+            counts = self.rejects[r]
+            counts[0] += total - after_limit
+            counts[1] += after_limit - after_avail
+            counts[2] += after_avail - after_guard
+        return mask
+
+    def visit(self, rows):
+        """依表演權重由小到大取出row"""
+        if self.rng is None:
+            heap = [(self.weight[r], r) for r in rows]
+        else:
+            heap = [(self.weight[r] + self.rng.uniform(0, NOISE), r) for r in rows]
+        heapq.heapify(heap)
+        while heap:
+            yield heapq.heappop(heap)[1]
+
+    def pair_fill(self, rows):
+        """一次塞兩份工作，兩場一組 (第1,2場)、(第3,4場)...，同組兩場都在rows中才一起塞"""
+        allowed = set(rows)
+        done = set()
+        for row in self.visit(rows):
+            if row in done:
+                continue
+            _, first, last = self.segment(row)
+            partner = row + 1 if (row - first) % 2 == 0 else row - 1
+            done.add(row)
+            done.add(partner)
+            if partner > last or partner not in allowed: # 落單的一場留給補空位
+                continue
+            a, b = min(row, partner), max(row, partner)
+            mask = self.screen([a, b], 2, first, last)
+            self.fill([a, b], self.queue.candidates(mask))
+
+    def single_fill(self, rows):
+        """補空位，每次塞一份工作"""
+        for row in self.visit(rows):
+            _, first, last = self.segment(row)
+            mask = self.screen([row], 1, first, last)
+            self.fill([row], self.queue.candidates(mask))
+
+    def warm_up_fill(self, row):
+        """補預熱闈場"""
+        mask = self.screen([row], 1)
+        self.fill([row], self.queue.candidates(mask))
+
+    def generate(self):
+        """自動生成細流，回傳job_arr，各階段的耗時及填滿的時段數記錄在Stats"""
+        fh_rows = list(range(1, self.F + 1))
+        sh_rows = list(range(self.F + 2, self.max_row))
+        with Stats.timer('generate.pair_fill'):
+            self.pair_fill(fh_rows)
+            self.pair_fill(sh_rows)
+        with Stats.timer('generate.single_fill'):
+            self.single_fill(fh_rows)
+            self.single_fill(sh_rows)
+        with Stats.timer('generate.warm_up_fill'):
+            self.warm_up_fill(0)
+            self.warm_up_fill(self.F + 1)
+        if Stats.enabled:
+            Stats.count('generate.rows_filled', sum(1 for row in self.arr if all(row)))
+        return self.arr
+
+    def refill(self, rows):
+        """只在rows中補上工作，已經有人的格子不動"""
+        self.screened = True # 沒有要補的row時，空格原因都是0
+        warm_rows = [r for r in (0, self.F + 1) if r in rows]
+        perf_rows = [r for r in rows if r not in warm_rows]
+        self.pair_fill(perf_rows)
+        self.single_fill(perf_rows)
+        for r in warm_rows:
+            self.warm_up_fill(r)
+
+    def keep(self, row, col, name):
+        """
+        保留舊細流中的一格，回傳是否保留
+        人員已被刪除、該時段要表演或場協、失去火區許可、優先度降低後超過工作上限時不保留
+        """
+        if name not in self.index:
+            return False
+        i = self.index[name]
+        if self.jobs[i] >= self.limit[i]:
+            return False
+        if self.base[i, row] == BUSY or self.assigned[i, row]:
+            return False
+        if col in FIRE_COLS and not self.fire_ok[i]:
+            return False
+        self.assign(i, row, col)
+        return True
+
+    def penalty(self):
+        """細流的扣分，越小越好: 空格、火區空格、排在準備或剛下場的工作、工作分配不平均"""
+        empty = sum(1 for row in self.arr for name in row if not name)
+        fire_empty = sum(1 for row in self.arr for c in FIRE_COLS if not row[c])
+        soft = sum(PENALTY_SOFT.get(int(self.base[self.index[name], row]), 0)
+                   for row, _, name in self.cells() if name in self.index)
+        spread = int((self.jobs.astype(np.int64) ** 2).sum())
+        return PENALTY_EMPTY * empty + PENALTY_FIRE * fire_empty + soft + spread
+
+    def report(self):
+        """
+        排班結果的空格原因，只載入細流沒有自動排班時回傳None
+        回傳 [list] 每個時段一筆 {'row': job_arr的row, 'name': 表演名稱或預熱, 'empty': 空格數,
+        'fire_empty': 火區空格數, 'rejected': {規則: 刷掉的人數}}
+        """
+        if not self.screened:
+            return None
+        names = {row: name for name, row in self.perf_row.items()}
+        names[0] = '上半場預熱'
+        names[self.F + 1] = '下半場預熱'
+        result = []
+        for row in range(self.max_row):
+            result.append({
+                'row': row,
+                'name': names.get(row, ''),
+                'empty': sum(1 for name in self.arr[row] if not name),
+                'fire_empty': sum(1 for c in FIRE_COLS if not self.arr[row][c]),
+                'rejected': dict(zip(REJECTIONS, self.rejects[row])),
+            })
+        return result
+
+    def table_row(self, row):
+        """job_arr的row轉為細流表格的row (中間多了中場休息)"""
+        return row if row <= self.F else row + 1
+
+    def apply(self, staff_dic):
+        """
+        將權重、工作數量寫回表演及人員資料，供表格顯示
+        空閒程度及工作位置不另外複製，直接查詢avail及job_cells
+        """
+        for name, row in self.perf_row.items():
+            half = self.first_half if row <= self.F else self.second_half
+            half[name]['weight'] = int(self.weight[row])
+        for i, name in enumerate(self.names):
+            staff = staff_dic[name]
+            staff['limit'] = int(self.limit[i])
+            staff['jobs'] = int(self.jobs[i])
+            for key in ('job_index', 'available_f', 'available_s'): # 舊版本存檔留下的欄位
+                staff.pop(key, None)
+
+
+def snapshot(first_half, second_half, staff_dic):
+    """記錄排班時的輸入，供之後局部重排比對"""
+    staff = {}
+    for name, s in staff_dic.items():
+        staff[name] = {'priority': s['priority'], 'extinguish': s['extinguish'],
+                       'performances': list(s['performances']), 'assistances': list(s['assistances'])}
+    return {name: {} for name in first_half}, {name: {} for name in second_half}, staff
+
+
+def repair(old_input, first_half, second_half, staff_dic, job_arr, pinned=()):
+    """
+    表演或人員變動後，只重排限制有改變的時段及其前後場，其餘格子 (包含手動修改) 維持不變
+    old_input: [tuple] 上次排班時snapshot的結果
+    job_arr: [list] 上次排班後的細流
+    pinned: [set] job_arr中鎖定的 (row, col)，會跟著表演移到新的row
+    回傳 (Arranger, 重排的row)，新的鎖定位置在Arranger.pinned
+    """
+    old = Arranger(*old_input)
+
+    # 舊row -> 新row，表演以名稱對應
+    new_rows = perf_rows(first_half, second_half)
+    mapping = {0: 0, old.F + 1: len(first_half) + 1}
+    for name, row in old.perf_row.items():
+        if name in new_rows:
+            mapping[row] = new_rows[name]
+    inverse = {r: o for o, r in mapping.items()}
+
+    pins = {(mapping[r], c): job_arr[r][c] for r, c in pinned if r in mapping and r < len(job_arr)}
+    new = Arranger(first_half, second_half, staff_dic, pins=pins)
+    if not any(name for line in job_arr for name in line): # 還沒有生成過細流，整份重新生成
+        new.generate()
+        return new, list(range(new.max_row))
+
+    common = [name for name in new.names if name in old.index]
+    new_ids = [new.index[name] for name in common]
+    old_ids = [old.index[name] for name in common]
+
+    changed = set()
+    for r in range(new.max_row):
+        o = inverse.get(r)
+        if o is None: # 新的表演
+            changed.add(r)
+            continue
+        if (new.base[new_ids, r] != old.base[old_ids, o]).any(): # 有人的空閒程度改變
+            changed.add(r)
+            continue
+        _, first, last = new.segment(r)
+        if r >= first and any(first <= r + d <= last and inverse.get(r + d) != o + d for d in (-1, 1)): # 前後場換了
+            changed.add(r)
+
+    redo = set(changed)
+    for r in changed:
+        _, first, last = new.segment(r)
+        if r >= first:
+            redo.update(x for x in (r - 1, r + 1) if first <= x <= last)
+
+    refill = set(redo)
+    for o, r in mapping.items():
+        if r in redo or o >= len(job_arr):
+            continue
+        for col, name in enumerate(job_arr[o][:COLS]):
+            if name and (r, col) not in new.pinned and not new.keep(r, col, name):
+                refill.add(r)
+    new.refill(sorted(refill))
+    return new, sorted(redo)
+
+
+def restarts(first_half, second_half, staff_dic, seeds, pins=None):
+    """
+    依序以每個seed隨機排班，seed為None時為一般排班
+    seeds: [list] (編號, seed)
+    回傳 (扣分, 編號, seed) 中最好的一個，同分時取編號小的
+    """
+    best = None
+    for k, seed in seeds:
+        arranger = Arranger(first_half, second_half, staff_dic, seed=seed, pins=pins)
+        arranger.generate()
+        result = (arranger.penalty(), k, seed)
+        if best is None or result[:2] < best[:2]:
+            best = result
+    return best
+
+
+def best_of(first_half, second_half, staff_dic, n, seed=None, workers=None, pins=None):
+    """
+    以多個行程平行跑n次隨機排班，回傳扣分最少的那次的seed (None為一般排班)
+    同樣的seed排出同樣的細流，由呼叫端重新排一次即可取得細流及空格原因
+    其中一次為一般排班，結果不會比一般排班差
+    """
+    workers = workers or os.cpu_count() or 1
+    seeds = list(enumerate([None] + np.random.SeedSequence(seed).generate_state(max(n - 1, 0)).tolist()))
+    chunks = [seeds[k::workers] for k in range(workers) if seeds[k::workers]]
+    if len(chunks) == 1:
+        return restarts(first_half, second_half, staff_dic, chunks[0], pins)[2]
+    with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+        results = pool.map(restarts, *zip(*[(first_half, second_half, staff_dic, c, pins) for c in chunks]))
+        return min(results, key=lambda r: r[:2])[2]
@@ -1,6 +1,20 @@
-import json
-from PyQt5.QtWidgets import QFileDialog
+import copy
+import importlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtWidgets import QFileDialog, QInputDialog
 from PyQt5.QtCore import QTimer
+from Journal import Journal, apply
+from SaveFile import STAFF_KEYS, write_json, read_json, source, dump
+import Stats
+
+AUTO_SAVE = 'auto_save.json'
+JOURNAL = 'auto_save.journal' # 自動存檔之後的編輯紀錄
+JOURNAL_SYNC = 1000 # 編輯紀錄寫到磁碟的間隔 (毫秒)，期間的多筆紀錄合併為一次fsync
+COMPACT_SIZE = 1000 # 紀錄超過此行數時提早自動存檔
+FILE_FILTER = "JSON Files (*.json);;SQLite Files (*.sqlite);;All Files (*)"
+
 
 class Controller:
     def __init__(self):
@@ -12,13 +26,53 @@ class Controller:
         self.second_half = {}
         self.staff_dic = {}
         self.job_arr = [[]]
+        self.pinned = set() # 鎖定的格子 (job_arr的row, col)，生成細流時不會更動
         self.unique_id = 0
+        self.arranger = None # 細流的排班狀態及索引，資料變動後重新建立
+        self.snapshot = None # 上次生成細流時的輸入，局部重排時比對用
+        self.rejections = None # 上次生成細流時每個時段的空格原因，見Arranger.report
+
+        # 查詢用的索引，由表格在重新整理、排序、改名時更新
+        self.perf_index = {} # 表演名稱 -> ('first'/'second', 表演表格的row)
+        self.num_index = {} # 表演的num -> 表演名稱
+        self.staff_row = {} # 工作人員名字 -> 工作人員表格的row
+        self.staff_num = {} # 工作人員的num -> 名字
 
         self.file_path = None
+        self.project = None # 開啟.sqlite專案檔時的連線
+        self.show = None # 專案檔中目前編輯的演出名稱
 
+        # 表格重新整理的排程，同一輪事件迴圈中的多次要求合併為一次
+        self.dirty = {} # 表格 -> 需要重畫的範圍 (set)，None代表整個表格
+        self.refresh_timer = QTimer()
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(0)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+        # 自動存檔，資料沒有修改時略過，寫檔在背景執行緒進行
+        self.version = 0 # 每次修改資料加一
+        self.auto_saved = 0 # 上次自動存檔完成時的version
+        self.saver = ThreadPoolExecutor(max_workers=1)
+        self.saving = None # 進行中的自動存檔
+        self.journal = Journal(JOURNAL)
+        self.sync_timer = QTimer()
+        self.sync_timer.setSingleShot(True)
+        self.sync_timer.setInterval(JOURNAL_SYNC)
+        self.sync_timer.timeout.connect(self.sync_journal)
         self.auto_save_timer = QTimer()
-        self.auto_save_timer.timeout.connect(lambda: self.save_file('auto'))
-        self.auto_save_timer.start(60000)
+        self.auto_save_timer.timeout.connect(self.auto_save)
+
+    def start(self):
+        """
+        主視窗第一次顯示後呼叫，初始化自動存檔及復原等非必要功能
+        排班引擎 (numpy) 在背景執行緒預先載入，第一次生成細流時不用等待
+        """
+        try:
+            self.auto_save_timer.start(60000)
+            self.recover() # 上次沒有正常關閉時復原
+            threading.Thread(target=importlib.import_module, args=('Arranger',), daemon=True).start()
+        except Exception as e:
+            print('Controller.py: start', e)
 
     def clear_highlight(self):
         try:
@@ -28,50 +82,225 @@ class Controller:
         except Exception as e:
             print('Controller.py: clear_highlight', e)
 
+    def schedule(self, view, rows=None):
+        """
+        標記表格需要重新整理，回到事件迴圈時再一次處理
+        rows: [iterable] 需要重畫的範圍，意義由各表格的refresh決定，None代表整個表格
+        """
+        if rows is None or (view in self.dirty and self.dirty[view] is None):
+            self.dirty[view] = None
+        else:
+            self.dirty.setdefault(view, set()).update(rows)
+        self.refresh_timer.start()
+
+    def refresh(self):
+        """處理所有排程中的重新整理，每個表格只處理一次"""
+        try:
+            dirty, self.dirty = self.dirty, {}
+            for view, rows in dirty.items():
+                with Stats.timer('refresh.' + type(view).__name__):
+                    view.refresh(rows)
+                if rows is not None:
+                    Stats.count('refresh.cells', len(rows))
+        except Exception as e:
+            print('Controller.py: refresh', e)
+
+    def get_arranger(self):
+        """取得與目前細流同步的Arranger，失效時根據現有資料重新建立"""
+        if self.arranger is None:
+            from Arranger import Arranger # 依賴numpy，第一次使用時才載入
+            self.arranger = Arranger(self.first_half, self.second_half, self.staff_dic, self.job_arr)
+        return self.arranger
+
+    def invalidate(self):
+        """表演或工作人員名單改變時呼叫，下次使用時重建Arranger，並重畫細流的衝突標示"""
+        self.arranger = None
+        self.touch()
+        if self.flow_table:
+            self.schedule(self.flow_table)
+
+    def touch(self):
+        """資料有修改時呼叫，讓下次自動存檔寫入"""
+        self.version += 1
+
+    def record(self, op, **entry):
+        """記錄一筆修改，種類及內容見Journal.apply"""
+        try:
+            self.touch()
+            self.journal.append({'v': self.version, 'op': op, **entry})
+            if not self.sync_timer.isActive():
+                self.sync_timer.start()
+            if self.journal.count >= COMPACT_SIZE:
+                self.auto_save()
+        except Exception as e:
+            print('Controller.py: record', e)
+
+    def sync_journal(self):
+        """將編輯紀錄寫到磁碟，斷電時也能復原"""
+        try:
+            self.journal.sync()
+        except Exception as e:
+            print('Controller.py: sync_journal', e)
+
+    def record_staff(self, *names):
+        """記錄工作人員的新增、修改或刪除"""
+        for name in names:
+            staff = self.staff_dic.get(name)
+            self.record('staff', name=name, data=staff and source(staff, STAFF_KEYS), unique_id=self.unique_id)
+
+    def state(self):
+        """要存檔的資料，只包含原始資料"""
+        return dump(self.first_half, self.second_half, self.staff_dic, self.job_arr, self.pinned, self.unique_id)
+
+    def auto_save(self):
+        """
+        資料有修改時自動存檔到auto_save.json
+        在主執行緒複製一份資料，轉為json及寫檔交給背景執行緒，介面不會卡住
+        存檔完成後刪掉已經存進檔案的編輯紀錄
+        """
+        try:
+            if self.version == self.auto_saved or (self.saving and not self.saving.done()):
+                return
+            version = self.version
+            with Stats.timer('auto_save'): # 只計算主執行緒的部分
+                data = copy.deepcopy(self.state())
+            data['version'] = version
+
+            def save():
+                write_json(AUTO_SAVE, data)
+                self.journal.compact(version)
+            self.saving = self.saver.submit(save)
+
+            def done(future):
+                if future.exception():
+                    print('Controller.py: auto_save', future.exception())
+                else:
+                    self.auto_saved = version
+            self.saving.add_done_callback(done)
+        except Exception as e:
+            print('Controller.py: auto_save', e)
+
+    def recover(self):
+        """
+        啟動時呼叫，上次沒有正常關閉時讀取自動存檔並套用之後的編輯紀錄
+        正常關閉後自動存檔仍會保留，所以每次啟動的編輯紀錄都從起始狀態 (load) 開始
+        回傳是否有復原
+        """
+        try:
+            state = {"first_half": {}, "second_half": {}, "staff_dic": {}, "job_arr": [[]], "pinned": [], 'unique_id': 0}
+            if os.path.exists(AUTO_SAVE):
+                state = read_json(AUTO_SAVE)
+            saved = state.get('version', 0)
+            # 起始狀態的紀錄與自動存檔同一個版本，也要套用
+            entries = [e for e in self.journal.entries() if e['v'] > saved or (e['v'] == saved and e['op'] == 'load')]
+            self.version = self.auto_saved = saved
+            if not entries:
+                # 沒有復原時從空白開始，先記錄起始狀態，之後當機時才不會套用到上一次的自動存檔
+                # 不增加版本，沒有修改時不會自動存檔蓋掉上一次的自動存檔
+                self.journal.append({'v': self.version, 'op': 'load', 'state': self.state()})
+                self.journal.sync()
+                return False
+            for entry in entries:
+                apply(state, entry)
+            self.load_state(state)
+            self.version = entries[-1]['v']
+            return True
+        except Exception as e:
+            print('Controller.py: recover', e)
+            return False
+
+    def close(self):
+        """正常關閉時呼叫，等待自動存檔完成後刪除編輯紀錄"""
+        try:
+            self.auto_save()
+            self.saver.shutdown(wait=True)
+            if self.version == self.auto_saved:
+                self.journal.clear()
+            if self.project is not None:
+                self.project.close()
+        except Exception as e:
+            print('Controller.py: close', e)
+
+    def load_state(self, data):
+        """載入存檔資料，重新計算衍生資料後重新整理所有表格"""
+        self.first_half = data["first_half"]
+        self.second_half = data["second_half"]
+        self.staff_dic = data["staff_dic"]
+        self.job_arr = data["job_arr"]
+        self.pinned = set(tuple(p) for p in data.get("pinned", []))
+        self.unique_id = data['unique_id']
+        self.snapshot = None
+        self.rejections = None
+        self.invalidate()
+        self.get_arranger().apply(self.staff_dic) # 工作數量、權重存檔時不保留，由Arranger重新計算
+        self.staff_table.update()
+        self.flow_table.update()
+        self.performance_table.update()
+
+    def open_project(self, file_path):
+        """開啟.sqlite專案檔，換檔時關閉原本的連線"""
+        if self.project is None or self.project.file_path != file_path:
+            if self.project is not None:
+                self.project.close()
+            from Project import Project
+            self.project = Project(file_path)
+        return self.project
+
     def read_file(self):
         try:
             file_path, _ = QFileDialog.getOpenFileName(
-                None, "選擇檔案", "", "JSON Files (*.json);;All Files (*)"
+                None, "選擇檔案", "", FILE_FILTER
             )
-            if file_path:
-                self.file_path = file_path
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-
-                self.first_half = data["first_half"]
-                self.second_half = data["second_half"]
-                self.staff_dic = data["staff_dic"]
-                self.job_arr = data["job_arr"]
-                self.unique_id = data['unique_id']
-                self.staff_table.update()
-                self.flow_table.update()
-                self.performance_table.update()
+            if not file_path:
+                return
+            if file_path.endswith('.sqlite'):
+                shows = self.open_project(file_path).shows()
+                if not shows:
+                    return
+                show = shows[0]
+                if len(shows) > 1: # 專案檔有多場演出時選擇要開啟的那一場，其他場不讀取
+                    show, ok = QInputDialog.getItem(None, "選擇演出", "演出", shows, len(shows) - 1, False)
+                    if not ok:
+                        return
+                with Stats.timer('load.read'):
+                    data = self.project.load(show)
+                self.show = show
+            else:
+                with Stats.timer('load.read'):
+                    data = read_json(file_path)
+                self.show = None
+            self.file_path = file_path
+
+            with Stats.timer('load'):
+                self.load_state(data)
+            self.record('load', state=self.state())
         except Exception as e:
             print('Controller.py: read_file', e)
 
     def save_file(self, mode):
         try:
-            if mode == 'auto':
-                file_path = 'auto_save.json'
-            elif (mode == 'save' and not self.file_path) or mode == 'save as':
+            if (mode == 'save' and not self.file_path) or mode == 'save as':
                 file_path, _ = QFileDialog.getSaveFileName(
-                    None, "儲存檔案", "save_file.json", "JSON Files (*.json);;All Files (*)"
+                    None, "儲存檔案", "save_file.json", FILE_FILTER
                 )
                 if file_path:
                     self.file_path = file_path
+                    self.show = None
             else:
                 file_path = self.file_path
 
-            if file_path:
-                data = {
-                    "first_half": self.first_half,
-                    "second_half": self.second_half,
-                    "staff_dic": self.staff_dic,
-                    "job_arr": self.job_arr,
-                    'unique_id': self.unique_id
-                }
-
-                with open(file_path, "w", encoding="utf-8") as f:
-                    json.dump(data, f, ensure_ascii=False, indent=4)
+            if not file_path:
+                return
+            if file_path.endswith('.sqlite'):
+                if self.show is None: # 第一次存進專案檔時命名這場演出
+                    show, ok = QInputDialog.getText(None, "演出名稱", "演出名稱")
+                    if not ok or not show:
+                        return
+                    self.show = show
+                with Stats.timer('save'):
+                    self.open_project(file_path).save(self.show, self.state())
+            else:
+                with Stats.timer('save'):
+                    write_json(file_path, self.state(), indent=4)
         except Exception as e:
             print('Controller.py: save_file', e)
\ No newline at end of file
@@ -0,0 +1,72 @@
+"""
+匯出細流為Excel
+不依賴Qt，直接讀取表演資料及job_arr，以openpyxl的write-only模式逐列寫入
+openpyxl在第一次匯出時才載入，不拖慢程式啟動
+"""
+import os
+
+HEADERS = ['表演者', '準備一', '準備二', '闈場(1.2.3.4.5.6)', '左火區 / 右火區']
+
+
+def flow_labels(first_half, second_half):
+    """細流每一列的 [表演者, 準備一, 準備二]，包含預熱及中場休息，共F+S+3列"""
+    fh = list(first_half.keys())
+    sh = list(second_half.keys())
+    F = len(fh)
+    labels = [['', '', ''] for _ in range(len(fh) + len(sh) + 3)]
+    labels[0][0] = "上半場預熱"
+    labels[F+1][0] = "中場休息"
+    labels[F+2][0] = "下半場預熱"
+    for start, names in ((1, fh), (F+3, sh)):
+        for i, name in enumerate(names):
+            row = start + i
+            labels[row][0] = name
+            if i >= 1:
+                labels[row-1][1] = name
+            if i >= 2:
+                labels[row-2][2] = name
+    return labels
+
+
+def flow_rows(first_half, second_half, job_arr):
+    """依序產生細流每一列要輸出的內容，中場休息只有一格"""
+    labels = flow_labels(first_half, second_half)
+    F = len(first_half)
+    for row, label in enumerate(labels):
+        if row == F+1:
+            yield ['中場休息']
+            continue
+        arr_row = row if row <= F else row-1
+        jobs = job_arr[arr_row] if arr_row < len(job_arr) else []
+        jobs = list(jobs) + [''] * (10 - len(jobs))
+        security = '、'.join(jobs[0:6])
+        extinguish = '、'.join(jobs[6:8]) + ' / ' + '、'.join(jobs[8:10])
+        yield label + [security, extinguish]
+
+
+def write_xlsx(file_path, first_half, second_half, job_arr, progress=None):
+    """
+    將細流寫入file_path，先寫入暫存檔再取代原檔
+    progress: [function] 每寫完一列呼叫 progress(已完成列數, 總列數)
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    total = len(first_half) + len(second_half) + 3
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    header = []
+    for text in HEADERS:
+        cell = WriteOnlyCell(ws, value=text)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    ws.append(header)
+    for i, row in enumerate(flow_rows(first_half, second_half, job_arr)):
+        ws.append(row)
+        if progress:
+            progress(i + 1, total)
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        wb.save(f)
+    os.replace(tmp_path, file_path)
@@ -1,19 +1,166 @@
-from PyQt5.QtWidgets import QTableWidget, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableWidgetItem, QMessageBox, QFileDialog
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QColor
-from pandas import DataFrame
-import openpyxl
-
-class CustomTable(QTableWidget):
-    def __init__(self, controller, row, col):
+from PyQt5.QtWidgets import QTableView, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QMessageBox, QFileDialog, QComboBox, QSpinBox, QCheckBox, QMenu, QAction, QAbstractItemView
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QDataStream, QIODevice, QThread, pyqtSignal
+from PyQt5.QtGui import QColor, QFont
+from Exporter import write_xlsx, flow_labels
+from Generator import MODES, arrange, problems
+import Stats
+from Highlight import Highlight
+
+HEADERS = ['表演者', '準備一', '準備二', '闈場1', '闈場2', '闈場3', '闈場4', '闈場5', '闈場6', '左火區1', '左火區2', '右火區1', '右火區2']
+ITEM_MIME = 'application/x-qabstractitemmodeldatalist' # Qt表格拖曳時使用的格式
+
+class FlowModel(QAbstractTableModel):
+    """
+    細流表格的資料，直接讀取controller.job_arr，不另外建立儲存格物件
+    表演名稱在reset時整理一次，工作人員、鎖定、衝突、高亮都在顯示時才查詢
+    """
+
+    def __init__(self, flow_table):
+        super().__init__()
+        self.flow_table = flow_table
+        self.controller = flow_table.controller
+        self.F = 0 # 上半場表演數量，細流表格第F+1列為中場休息
+        self.labels = [] # 每列的 表演者、準備一、準備二
+        self.bold = QFont()
+        self.bold.setBold(True)
+        self.red = QColor('red')
+
+    def reset(self):
+        """表演順序改變或重新生成細流後，重新整理表演名稱及列數"""
+        self.beginResetModel()
+        self.F = len(self.controller.first_half)
+        self.flow_table.highlight.reset()
+        self.labels = flow_labels(self.controller.first_half, self.controller.second_half)
+        self.endResetModel()
+
+    def arrIndex(self, row, col):
+        """表格的 (row, col) 轉為job_arr的 (row, col)，表演名稱及中場休息回傳None"""
+        if col < 3 or row == self.F+1:
+            return None
+        return (row if row <= self.F else row-1, col-3)
+
+    def tableIndex(self, row, col):
+        """job_arr的 (row, col) 轉為表格的index"""
+        return self.index(row if row <= self.F else row+1, col+3)
+
+    def text(self, row, col):
+        if col < 3:
+            return self.labels[row][col]
+        coor = self.arrIndex(row, col)
+        arr = self.controller.job_arr
+        if coor is None or coor[0] >= len(arr) or coor[1] >= len(arr[coor[0]]):
+            return ''
+        return arr[coor[0]][coor[1]]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.labels)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        row, col = index.row(), index.column()
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self.text(row, col)
+        if role == Qt.BackgroundRole:
+            return self.flow_table.highlight.background(row, col)
+        if role == Qt.ToolTipRole and col == 0:
+            return self.emptyReason(row)
+        coor = self.arrIndex(row, col)
+        if coor is None or not self.text(row, col):
+            return None
+        if role == Qt.FontRole:
+            return self.bold if coor in self.controller.pinned else None
+        if role in (Qt.ForegroundRole, Qt.ToolTipRole):
+            found = self.controller.get_arranger().conflict_index().get(coor)
+            if not found:
+                return None
+            return self.red if role == Qt.ForegroundRole else '、'.join(found)
+        return None
+
+    def emptyReason(self, row):
+        """表演名稱的提示: 上次生成細流時該時段有空格的話，列出各規則刷掉的人數"""
+        rejections = self.controller.rejections
+        if not rejections or row == self.F+1:
+            return None
+        entry = rejections[row if row <= self.F else row-1]
+        if not entry['empty']:
+            return None
+        reasons = '、'.join(f"{rule} {n}" for rule, n in entry['rejected'].items() if n)
+        return f"空格 {entry['empty']} (火區 {entry['fire_empty']})\n被刷掉的人數: {reasons or '無'}"
+
+    def flags(self, index):
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled
+        if self.arrIndex(index.row(), index.column()) is not None:
+            flags |= Qt.ItemIsEditable | Qt.ItemIsDropEnabled
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or self.arrIndex(index.row(), index.column()) is None:
+            return False
+        self.flow_table.changed(index.row(), index.column(), str(value))
+        return True
+
+    def refresh(self, cells):
+        """
+        通知表格重畫job_arr中的格子
+        cells: [list] job_arr的 (row, col)
+        """
+        for row, col in cells:
+            index = self.tableIndex(row, col)
+            self.dataChanged.emit(index, index)
+
+    def supportedDropActions(self):
+        return Qt.CopyAction
+
+    def mimeTypes(self):
+        return [ITEM_MIME]
+
+    def dropMimeData(self, data, action, row, col, parent):
+        """將拖曳的名字複製到放開的格子，拖曳多格時維持相對位置"""
+        if parent.isValid():
+            row, col = parent.row(), parent.column()
+        if row < 0 or col < 0 or not data.hasFormat(ITEM_MIME):
+            return False
+        items = []
+        encoded = data.data(ITEM_MIME) # QDataStream不會保留QByteArray，需自行保存
+        stream = QDataStream(encoded, QIODevice.ReadOnly)
+        while not stream.atEnd():
+            r, c, n = stream.readInt32(), stream.readInt32(), stream.readInt32()
+            roles = {}
+            for _ in range(n):
+                role = stream.readInt32()
+                roles[role] = stream.readQVariant()
+            items.append((r, c, roles.get(Qt.DisplayRole) or ''))
+        if not items:
+            return False
+        top = min(r for r, _, _ in items)
+        left = min(c for _, c, _ in items)
+        dropped = False
+        for r, c, text in items:
+            target = self.index(row + r - top, col + c - left)
+            if target.isValid() and self.arrIndex(target.row(), target.column()) is not None:
+                dropped = self.setData(target, str(text)) or dropped
+        return dropped
+
+class CustomTable(QTableView):
+    def __init__(self, controller):
         try:
-            super().__init__(row, col)
+            super().__init__()
             self.controller = controller
             self.setAcceptDrops(True)
             self.setDragEnabled(True)
             self.setDropIndicatorShown(True)
+            self.setDragDropMode(QAbstractItemView.DragDrop)
+            self.setDragDropOverwriteMode(True)
+            self.setDefaultDropAction(Qt.CopyAction)
             self.setStyleSheet("""
-                QTableWidget::item:selected {
+                QTableView::item:selected {
                     background-color: #2828ff;
                 }
             """)
@@ -21,38 +168,77 @@ class CustomTable(QTableWidget):
             print('FlowTable.py: __init__', e)
 
     def dropEvent(self, event):
-        """無視對表演名稱的更改，允許更改工作人員"""
+        """只接受工作人員表格及細流本身的拖曳，表演名稱由model拒絕"""
         try:
-            pos = event.pos()
-            item = self.itemAt(pos)
-            if event.source() == self.controller.staff_table.table:
-                pos = event.pos()
-                item = self.itemAt(pos)
-                if item.column() < 3 or item.row() == len(self.controller.first_half)+1:
-                    event.ignore()
-                else:
-                    super().dropEvent(event)
-                    self.parent().highlighted.append((item.row(), item.column()))
-            if event.source() == self:
+            if event.source() in (self, self.controller.staff_table.table):
                 super().dropEvent(event)
-
+            else:
+                event.ignore()
         except Exception as e:
             print('FlowTable.py: dropEvent', e)
 
+class ExportThread(QThread):
+    """在背景執行緒匯出Excel，以百分比回報進度"""
+    progress = pyqtSignal(int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, file_path, first_half, second_half, job_arr):
+        super().__init__()
+        self.file_path = file_path
+        self.first_half = first_half
+        self.second_half = second_half
+        self.job_arr = job_arr
+        self.percent = -1
+        self.ok = False
+
+    def report(self, done, total):
+        percent = done * 100 // total
+        if percent != self.percent: # 百分比有變才通知介面
+            self.percent = percent
+            self.progress.emit(percent)
+
+    def run(self):
+        try:
+            write_xlsx(self.file_path, self.first_half, self.second_half, self.job_arr, self.report)
+            self.ok = True
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class GenerateThread(QThread):
+    """在背景執行緒生成細流，視窗在生成期間仍會重畫及回應"""
+    failed = pyqtSignal(str)
+
+    def __init__(self, version, *args, **kwargs):
+        super().__init__()
+        self.version = version # 開始生成時controller的資料版本，結束時不同就不套用
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None # (Arranger, 空格原因)
+
+    def run(self):
+        try:
+            with Stats.timer('generate'):
+                self.result = arrange(*self.args, **self.kwargs)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
 class FlowTable(QWidget):
     def __init__(self, controller):
         try:
             super().__init__()
 
-            self.systemChange = False
-
             self.controller = controller
             self.controller.flow_table = self
 
             # Table
-            self.table = CustomTable(self.controller, 0, 13)
-            self.table.setHorizontalHeaderLabels(['表演者', '準備一', '準備二', '闈場1', '闈場2', '闈場3', '闈場4', '闈場5', '闈場6', '左火區1', '左火區2', '右火區1', '右火區2'])
-            self.table.cellChanged.connect(self.changed)
+            self.model = FlowModel(self)
+            self.table = CustomTable(self.controller)
+            self.table.setModel(self.model)
+            self.highlight = Highlight(self.table)
+            self.table.setContextMenuPolicy(Qt.CustomContextMenu)
+            self.table.customContextMenuRequested.connect(self.showCellMenu)
 
             # Title & Button
             title = QLabel("細流")
@@ -66,24 +252,49 @@ class FlowTable(QWidget):
                 border: 2px solid #003060;
                 border-radius: 5px;
             """)
-            output_button = QPushButton("輸出表格")
-            output_button.setFixedSize(80, 20)
-            output_button.clicked.connect(self.output)
+            self.output_button = QPushButton("輸出表格")
+            self.output_button.setFixedSize(80, 20)
+            self.output_button.clicked.connect(self.output)
+            self.exporter = None # 進行中的Excel匯出
 
             check_button = QPushButton("自動檢查")
             check_button.setFixedSize(80, 20)
             check_button.clicked.connect(self.check)
 
-            generate_button = QPushButton("生成細流")
-            generate_button.setFixedSize(80, 20)
-            generate_button.clicked.connect(self.generate)
+            self.generate_button = QPushButton("生成細流")
+            self.generate_button.setFixedSize(80, 20)
+            self.generate_button.clicked.connect(self.generate)
+            self.generator = None # 進行中的生成
+
+            self.mode = QComboBox()
+            self.mode.addItems(MODES)
+            self.mode.setToolTip("快速: 依序排入工作\n最佳化: 在時間上限內盡量填滿所有工作\n多次隨機: 用所有CPU核心隨機排班多次，取最好的結果\n局部重排: 表演變動後只重排受影響的時段，保留其他手動修改")
+            self.mode.currentTextChanged.connect(self.modeChanged)
+            self.time_budget = QSpinBox()
+            self.time_budget.setRange(1, 600)
+            self.time_budget.setValue(5)
+            self.time_budget.setSuffix(" 秒")
+            self.time_budget.setToolTip("最佳化及局部優化的時間上限，時間到時使用目前找到最好的細流")
+            self.restarts = QSpinBox()
+            self.restarts.setRange(1, 10000)
+            self.restarts.setValue(64)
+            self.restarts.setSuffix(" 次")
+            self.restarts.setToolTip("多次隨機的排班次數")
+            self.improve = QCheckBox("局部優化")
+            self.improve.setToolTip("生成後再反覆嘗試換人、搬移工作，減少空格並平均分配工作\n必要時會把工作排在準備或剛下場的時段")
+            self.improve.toggled.connect(lambda: self.modeChanged(self.mode.currentText()))
+            self.modeChanged(self.mode.currentText())
 
             # Sub Layout
             top_layout = QHBoxLayout()
             top_layout.addWidget(title)
-            top_layout.addWidget(output_button)
+            top_layout.addWidget(self.output_button)
             top_layout.addWidget(check_button)
-            top_layout.addWidget(generate_button)
+            top_layout.addWidget(self.mode)
+            top_layout.addWidget(self.time_budget)
+            top_layout.addWidget(self.restarts)
+            top_layout.addWidget(self.improve)
+            top_layout.addWidget(self.generate_button)
 
             # Layout
             main_layout = QVBoxLayout()
@@ -91,66 +302,64 @@ class FlowTable(QWidget):
             main_layout.addWidget(self.table)
             self.setLayout(main_layout)
             
-            self.highlighted = []
-            self.table.cellClicked.connect(self.clicked)
+            self.table.clicked.connect(lambda index: self.clicked(index.row(), index.column()))
         except Exception as e:
             print('FlowTable.py: __init__', e)
 
-    def changed(self, row, col):
+    def changed(self, row, col, name):
         """
         使用者改變格子內容時，更新對應資料
         """
         try:
-            if self.systemChange == True:
-                return
             if col < 3:
                 return
-            fh = self.controller.first_half
-            sh = self.controller.second_half
             staff_dic = self.controller.staff_dic
             arr = self.controller.job_arr
-            arr_row = row if row <= len(fh) else row-1
-            prev_name = arr[arr_row][col-3]
-            name = self.table.item(row, col).text()
+            arr_row, arr_col = self.model.arrIndex(row, col)
+            prev_name = arr[arr_row][arr_col]
             if name != prev_name:
-                arr[arr_row][col-3] = name
-                half = fh if row <= len(fh) else sh
-                available = 'available_f' if row <= len(fh) else 'available_s'
-                available_row = row if row <= len(fh) else row-1-len(fh)
-                staff_dic[name]['jobs'] += 1
-                staff_dic[name]['job_index'].append([row, col])
-                staff_dic[name][available][available_row] = 1
-                if prev_name:
-                    staff_dic[prev_name]['jobs'] -= 1
-                    staff_dic[prev_name]['job_index'].remove([row, col])
-
-                    a = [10] * (len(half) + 1)
-                    i = 1
-                    for p in half.keys():
-                        if p in staff_dic[prev_name]["performances"]:
-                            a[0] = 0
-                            a[i] = 0
-                            if i-1 > 0:
-                                a[i-1] = 3 # 降低準備一
-                            if i-2 > 0:
-                                a[i-2] = 3 # 降低準備二
-                            if i+1 <= len(half): 
-                                a[i+1] = 7 # 降低下一場
-                        elif p in staff_dic[prev_name]['assistances']:
-                            a[i] = 0
-                            if i-1 > 0:
-                                a[i-1] = 3
-                        else:
-                            for r, _ in staff_dic[prev_name]['job_index']:
-                                if r == row:
-                                    a[i] = 1
-                        i += 1
-
-                    staff_dic[prev_name][available] = a
-                self.controller.staff_table.update()
+                if not name:
+                    self.controller.pinned.discard((arr_row, arr_col)) # 清空的格子不再鎖定
+                arranger = self.controller.get_arranger()
+                touched = arranger.set_cell(arr_row, arr_col, name)
+                self.controller.record('cell', row=arr_row, col=arr_col, name=name)
+                arr[arr_row][arr_col] = name
+                self.model.refresh([(arr_row, arr_col)] + touched)
+                for n in (name, prev_name):
+                    if n in staff_dic and n in arranger.index:
+                        staff_dic[n]['jobs'] = int(arranger.jobs[arranger.index[n]])
+                self.controller.schedule(self.controller.staff_table, [n for n in (name, prev_name) if n])
         except Exception as e:
             print('FlowTable.py: changed', e)
 
+    def showCellMenu(self, pos):
+        """在工作人員的格子上點右鍵，可以鎖定或解除鎖定"""
+        try:
+            index = self.table.indexAt(pos)
+            if not index.isValid() or self.model.arrIndex(index.row(), index.column()) is None or not self.model.text(index.row(), index.column()):
+                return
+            coor = self.model.arrIndex(index.row(), index.column())
+            menu = QMenu(self)
+            action = QAction("解除鎖定" if coor in self.controller.pinned else "鎖定", menu)
+            action.setToolTip("鎖定的格子在生成細流時不會被更動")
+            action.triggered.connect(lambda: self.togglePin(*coor))
+            menu.addAction(action)
+            menu.exec_(self.table.viewport().mapToGlobal(pos))
+        except Exception as e:
+            print('FlowTable.py: showCellMenu', e)
+
+    def togglePin(self, row, col):
+        """切換job_arr中 (row, col) 的鎖定狀態，鎖定的格子以粗體顯示"""
+        try:
+            if (row, col) in self.controller.pinned:
+                self.controller.pinned.discard((row, col))
+            else:
+                self.controller.pinned.add((row, col))
+            self.controller.record('pin', row=row, col=col, pinned=(row, col) in self.controller.pinned)
+            self.model.refresh([(row, col)])
+        except Exception as e:
+            print('FlowTable.py: togglePin', e)
+
     def clicked(self, row, col):
         """
         點擊工作人員->高亮其他工作、顯示無法工作的場次
@@ -158,10 +367,7 @@ class FlowTable(QWidget):
         """
         try:
             self.controller.clear_highlight()
-            item = self.table.item(row, col)
-            if not item:
-                return
-            name = item.text()
+            name = self.model.text(row, col)
             if col >= 3: # 若點擊工作人員
                 self.highlightStaff(name)
                 self.controller.staff_table.highlightStaff(name)
@@ -175,428 +381,163 @@ class FlowTable(QWidget):
     def highlightStaff(self, name):
         """給予工作人員名字，高亮其在細流中的表演及工作"""
         try:
-            self.systemChange = True
             staff_dic = self.controller.staff_dic
             fh = self.controller.first_half
             sh = self.controller.second_half
             if name not in staff_dic:
                 return
+            colors = {}
+            rows = self.model.rowCount()
+            cols = self.model.columnCount()
             for p in staff_dic[name]['performances']: # 標出所有上半場表演
                 if p in fh:
                     num = fh[p]['num']
-                    for c in range(self.table.columnCount()):
-                        self.table.item(num, c).setBackground(QColor("#FF0000"))
-                        self.highlighted.append((num, c))
+                    for c in range(cols):
+                        colors[(num, c)] = "#FF0000"
                         if num - 1 >= 0:
-                            self.table.item(num-1, c).setBackground(QColor("#FF7575"))
-                            self.highlighted.append((num-1, c))
+                            colors[(num-1, c)] = "#FF7575"
                         if num - 2 >= 0:
-                            self.table.item(num-2, c).setBackground(QColor("#FF7575"))
-                            self.highlighted.append((num-2, c))
+                            colors[(num-2, c)] = "#FF7575"
                         if num + 1 <= len(fh):
-                            self.table.item(num+1, c).setBackground(QColor("#ffaf60"))
-                            self.highlighted.append((num+1, c))
+                            colors[(num+1, c)] = "#ffaf60"
             for p in staff_dic[name]['performances']: # 標出所有下半場表演
                 if p in sh:
                     num = sh[p]['num'] + 1
-                    for c in range(self.table.columnCount()):
-                        self.table.item(num, c).setBackground(QColor("#FF0000"))
-                        self.highlighted.append((num, c))
+                    for c in range(cols):
+                        colors[(num, c)] = "#FF0000"
                         if num - 1 > len(fh):
-                            self.table.item(num-1, c).setBackground(QColor("#FF7575"))
-                            self.highlighted.append((num-1, c))
+                            colors[(num-1, c)] = "#FF7575"
                         if num - 2 > len(fh):
-                            self.table.item(num-2, c).setBackground(QColor("#FF7575"))
-                            self.highlighted.append((num-2, c))
-                        if num + 1 < self.table.rowCount():
-                            self.table.item(num+1, c).setBackground(QColor("#ffaf60"))
-                            self.highlighted.append((num+1, c))
-            if 'job_index' not in staff_dic[name]:
-                return
-            for coor in staff_dic[name]['job_index']: # 標出所有工作
-                self.table.item(coor[0], coor[1]).setBackground(QColor("#ffffaa"))
-                self.highlighted.append((coor[0], coor[1]))
-            self.systemChange = False
+                            colors[(num-2, c)] = "#FF7575"
+                        if num + 1 < rows:
+                            colors[(num+1, c)] = "#ffaf60"
+            arranger = self.controller.get_arranger()
+            if name in arranger.index:
+                for r, c in arranger.job_cells(arranger.index[name]): # 標出所有工作
+                    colors[(arranger.table_row(r), c+3)] = "#ffffaa"
+            self.highlight.paint({coor: color for coor, color in colors.items() if coor[0] < rows})
         except Exception as e:
             print('FlowTable.py: highlightStaff', e)
 
     def clearHighlight(self):
         """清除高亮的儲存格"""
         try:
-            self.systemChange = True
-            for coor in self.highlighted:
-                self.table.item(coor[0], coor[1]).setBackground(QColor('white'))
-            self.systemChange = False
+            self.highlight.clear()
         except Exception as e:
             print('FlowTable.py: clearHighlight', e)
-        
+
     def generate(self):
-        """根據controller.first_half和controller.second_half和controller.staff_dic中的資料自動生成細流"""
+        """
+        根據controller.first_half和controller.second_half和controller.staff_dic中的資料自動生成細流
+        最佳化、多次隨機及局部優化在背景執行緒進行，期間三個表格暫停編輯，完成後在generateFinished套用結果
+        快速及局部重排只要幾毫秒，直接在主執行緒執行，不用重畫暫停編輯的表格
+        """
+        try:
+            if self.generator is not None and self.generator.isRunning():
+                return
+            self.controller.performance_table.numberPerformance()
+            mode = self.mode.currentText()
+            self.generator = GenerateThread(
+                self.controller.version,
+                self.controller.first_half, self.controller.second_half, self.controller.staff_dic,
+                mode, [list(row) for row in self.controller.job_arr], set(self.controller.pinned),
+                self.controller.snapshot,
+                time_budget=self.time_budget.value(), restarts=self.restarts.value(), improve=self.improve.isChecked())
+            self.generator.failed.connect(lambda e: print('FlowTable.py: generate', e))
+            if mode in ('最佳化', '多次隨機') or self.improve.isChecked():
+                self.generator.finished.connect(self.generateFinished)
+                self.setEditable(False)
+                self.generator.start()
+            else:
+                self.generator.run()
+                self.generateFinished()
+        except Exception as e:
+            print('FlowTable.py: generate', e)
+
+    def setEditable(self, editable):
+        """生成細流期間暫停編輯表演、工作人員及細流，按鈕顯示生成中"""
+        self.generate_button.setEnabled(editable)
+        self.generate_button.setText("生成細流" if editable else "生成中…")
+        for view in (self.table, self.controller.staff_table, self.controller.performance_table):
+            view.setEnabled(editable)
+
+    def generateFinished(self):
+        """生成完成後在主執行緒套用結果，期間讀取了其他檔案時捨棄"""
         try:
+            self.setEditable(True)
+            if self.generator.result is None or self.generator.version != self.controller.version:
+                return
+            from Arranger import snapshot
             fh = self.controller.first_half
             sh = self.controller.second_half
             staff_dic = self.controller.staff_dic
-            max_row = len(fh) + len(sh) + 2
-            arr = [["" for _ in range(10)] for _ in range(max_row)]
+            arranger, self.controller.rejections = self.generator.result
+            with Stats.timer('generate.apply'):
+                self.controller.job_arr = arranger.arr
+                self.controller.arranger = arranger
+                self.controller.pinned = set(arranger.pinned)
+                self.controller.snapshot = snapshot(fh, sh, staff_dic)
+                self.controller.record('job_arr', job_arr=arranger.arr, pinned=sorted(arranger.pinned))
+                for entry in self.controller.rejections or []:
+                    for rule, n in entry['rejected'].items():
+                        Stats.count('reject.' + rule, n)
+                arranger.apply(staff_dic)
+                self.update()
+                self.controller.schedule(self.controller.staff_table)
+            if arranger.optimal is not None and hasattr(self.window(), 'statusBar'):
+                self.window().statusBar().showMessage(
+                    "最佳化: 已證明最佳" if arranger.optimal else "最佳化: 時間到，使用目前找到最好的細流", 10000)
+        except Exception as e:
+            print('FlowTable.py: generateFinished', e)
 
-            # ========= 一些初始化 =========
-            self.controller.performance_table.numberPerformance()
+    def wait(self):
+        """關閉程式前等待進行中的生成及匯出完成"""
+        for thread in (self.generator, self.exporter):
+            if thread is not None:
+                thread.wait()
 
-            # ========= 計算各種權重 ========
-            for p in fh.values():
-                p['weight'] = 0
-            for p in sh.values():
-                p['weight'] = 0
-
-            for staff in staff_dic.values():
-                if staff['priority'] == '高':
-                    staff['limit'] = 6
-                elif staff['priority'] == '中':
-                    staff['limit'] = 4
-                elif staff['priority'] == '低':
-                    staff['limit'] = 2
-                elif staff['priority'] == '無':
-                    staff['limit'] = 0
-                staff['jobs'] = 0
-                staff['job_index'] = []
-
-                # 計算人員空閒時間
-                available_f = [10] * (len(fh) + 1)
-                i = 1
-                for performance in fh.keys():
-                    if performance in staff["performances"]:
-                        available_f[0] = 0 # 禁止預熱闈場
-                        available_f[i] = 0 # 禁止該表演
-                        if i-1 > 0:
-                            available_f[i-1] = 3 # 禁止準備一
-                        if i-2 > 0:
-                            available_f[i-2] = 3 # 降低準備二
-                        if i+1 < len(fh) + 1: 
-                            available_f[i+1] = 7 # 降低下一場
-                    elif performance in staff["assistances"]:
-                        available_f[i] = 0 # 禁止該表演
-                        if i-1 > 0:
-                            available_f[i-1] = 3 # 降低準備一
-                    i += 1
-                i = 1
-                available_s = [10] * (len(sh) + 1)
-                for performance in sh.keys():
-                    if performance in staff["performances"]:
-                        available_s[0] = 0 # 禁止預熱闈場
-                        available_s[i] = 0 # 禁止該表演
-                        if i-1 > 0:
-                            available_s[i-1] = 3 # 禁止準備一
-                        if i-2 > 0:
-                            available_s[i-2] = 3 # 降低準備二
-                        if i+1 < len(sh) + 1: 
-                            available_s[i+1] = 7 # 降低下一場
-                    elif performance in staff["assistances"]:
-                        available_s[i] = 0 # 禁止該表演
-                        if i-1 > 0:
-                            available_s[i-1] = 3 # 降低準備一
-                    i += 1
-                    
-                staff["available_f"] = available_f
-                staff["available_s"] = available_s
-            
-                # 計算表演權重
-                i = 1
-                for p in fh.values():
-                    p["weight"] += available_f[i]
-                    i += 1
-                i = 1
-                for p in sh.values():
-                    p["weight"] += available_s[i]
-                    i += 1
-
-            # 一次塞兩份工作 - 上半場
-            copy_h = dict(fh)
-            while copy_h:
-                sorted_h = sorted(copy_h.items(), key=lambda item: item[1]["weight"])
-                target = sorted_h[0]
-                row = target[1]["num"]
-                sorted_s = sorted(staff_dic.items(), key=lambda s: (s[1]['jobs']))
-
-                col = 0
-                offset = -1 if row % 2 == 0 else 1
-                for s in sorted_s:
-                    if row + offset < 0 or row + offset > len(fh): # 若offset超出範圍則跳出
-                        break
-                    if col == 10: # 若填完則跳出
-                        break
-                    if arr[row][col]: # 若已填入則跳過
-                        col += 1
-                        continue
-                    if s[1]["jobs"] + 2 > s[1]['limit']: # 限制個人工作數量上限
-                        continue
-                    if (row - 2 > 0 and s[0] in arr[row - 2]) or (row + 2 < len(fh)+1 and s[0] in arr[row + 2]): # 防止連續3+場工作
-                        continue
-                    if s[1]["available_f"][row] == 10 and s[1]["available_f"][row+offset] == 10:
-                        if (col == 6 or col == 8) and s[1]['extinguish'] == '不可':
-                            continue
-                        arr[row][col] = s[0]
-                        arr[row+offset][col] = s[0]
-                        s[1]["available_f"][row] = 1
-                        s[1]["available_f"][row+offset] = 1
-                        s[1]["job_index"].append([row, col+3])
-                        s[1]["job_index"].append([row+offset, col+3])
-                        s[1]["jobs"] += 2
-                        col += 1
-            
-                copy_h.pop(target[0])
-                for name, dic in copy_h.items():
-                    if dic["num"] == row + offset:
-                        copy_h.pop(name)
-                        break
-
-            # 一次塞兩個工作-下半場
-            copy_h = dict(sh)
-            while copy_h:
-                sorted_h = sorted(copy_h.items(), key=lambda item: item[1]["weight"])
-                target = sorted_h[0]
-                row = target[1]["num"]
-                idx = row - len(fh) - 1
-                sorted_s = sorted(staff_dic.items(), key=lambda s: (-s[1]["available_s"][idx], s[1]['jobs']))
-
-                col = 0
-                offset = -1 if idx % 2 == 0 else 1
-                for s in sorted_s:
-                    if idx + offset < 0 or idx + offset > len(sh): # 若offset超出範圍則跳出
-                        break
-                    if col == 10: # 若填完則跳出
-                        break
-                    if arr[row][col]: # 若已填入則跳過
-                        col += 1
-                        continue
-                    if s[1]["jobs"] + 2 > s[1]['limit']: # 限制個人工作數量上限
-                        continue
-                    if (row - 2 > 0 and s[0] in arr[row - 2]) or (row + 2 < max_row and s[0] in arr[row + 2]): # 防止連續3+場工作
-                        continue
-                    if s[1]["available_s"][idx] == 10 and s[1]["available_s"][idx+offset] == 10:
-                        if (col == 6 or col == 8) and s[1]['extinguish'] == '不可':
-                            continue
-                        arr[row][col] = s[0]
-                        arr[row+offset][col] = s[0]
-                        s[1]["available_s"][idx] = 1
-                        s[1]["available_s"][idx+offset] = 1
-                        s[1]["job_index"].append([row+1, col+3])
-                        s[1]["job_index"].append([row+offset+1, col+3])
-                        s[1]["jobs"] += 2
-                        col += 1
-                
-                copy_h.pop(target[0])
-                for name, dic in copy_h.items():
-                    if dic["num"] == row + offset:
-                        copy_h.pop(name)
-                        break
-                
-            # 補空位 - 上半場
-            copy_h = dict(fh)
-            while copy_h:
-                sorted_h = sorted(copy_h.items(), key=lambda item: item[1]["weight"])
-                target = sorted_h[0]
-                row = target[1]["num"]
-                sorted_s = sorted(staff_dic.items(), key=lambda s: (-s[1]["available_f"][row], s[1]['jobs']))
-
-                col = 0
-                offset = -1 if row % 2 == 0 else 1
-                for s in sorted_s:
-                    if col == 10: # 若填完則跳出
-                        break
-                    if arr[row][col]: # 若已填入則跳過
-                        col += 1
-                        continue
-                    if s[1]["jobs"] + 1 > s[1]['limit']: # 限制個人工作數量上限
-                        continue
-                    if (row - 1 > 0 and s[0] in arr[row - 1]) or (row + 1 < len(fh)+1 and s[0] in arr[row + 1]): # 防止連續3+場工作
-                        continue
-                    if s[1]["available_f"][row] == 10:
-                        if (col == 6 or col == 8) and s[1]['extinguish'] == '不可':
-                            continue
-                        arr[row][col] = s[0]
-                        s[1]["available_f"][row] = 1
-                        s[1]["job_index"].append([row, col+3])
-                        s[1]["jobs"] += 1
-                        col += 1
-                
-                copy_h.pop(target[0])
-
-            # 補空位 - 下半場
-            copy_h = dict(sh)
-            while copy_h:
-                sorted_h = sorted(copy_h.items(), key=lambda item: item[1]["weight"])
-                target = sorted_h[0]
-                row = target[1]["num"]
-                idx = row - len(fh) - 1
-                sorted_s = sorted(staff_dic.items(), key=lambda s: (-s[1]["available_s"][idx], s[1]['jobs']))
-
-                col = 0
-                offset = -1 if row % 2 == 0 else 1
-                for s in sorted_s:
-                    if col == 10: # 若填完則跳出
-                        break
-                    if arr[row][col]: # 若已填入則跳過
-                        col += 1
-                        continue
-                    if s[1]["jobs"] + 1 > s[1]['limit']: # 限制個人工作數量上限
-                        continue
-                    if (row - 1 > 0 and s[0] in arr[row - 1]) or (row + 1 < max_row and s[0] in arr[row + 1]): # 防止連續3+場工作
-                        continue
-                    if s[1]["available_s"][idx] == 10:
-                        if (col == 6 or col == 8) and s[1]['extinguish'] == '不可':
-                            continue
-                        arr[row][col] = s[0]
-                        s[1]["available_s"][idx] = 1
-                        s[1]["job_index"].append([row+1, col+3])
-                        s[1]["jobs"] += 1
-                        col += 1
-                
-                copy_h.pop(target[0])
-
-            # 補預熱
-            sorted_s = sorted(staff_dic.items(), key=lambda s: (-s[1]["available_f"][0], s[1]['jobs']))
-            col = 0
-            for s in sorted_s:
-                if col == 10:
-                    break
-                if s[1]["jobs"] + 1 > s[1]['limit']: # 限制個人工作數量上限
-                    continue
-                if s[1]["available_f"][0] == 10:
-                    if (col == 6 or col == 8) and s[1]['extinguish'] == '不可':
-                        continue
-                    arr[0][col] = s[0]
-                    s[1]["available_f"][0] = 1
-                    s[1]["job_index"].append([0, col+3])
-                    s[1]["jobs"] += 1
-                    col += 1
-
-            sorted_s = sorted(staff_dic.items(), key=lambda s: (-s[1]["available_s"][0], s[1]['jobs']))
-            col = 0
-            for s in sorted_s:
-                if col == 10:
-                    break
-                if s[1]["jobs"] + 1 > s[1]['limit']: # 限制個人工作數量上限
-                    continue
-                if s[1]["available_s"][0] == 10:
-                    if (col == 6 or col == 8) and s[1]['extinguish'] == '不可':
-                        continue
-                    arr[len(fh)+1][col] = s[0]
-                    s[1]["available_s"][0] = 1
-                    s[1]["job_index"].append([len(fh)+2, col+3])
-                    s[1]["jobs"] += 1
-                    col += 1
-
-            self.controller.job_arr = arr
-            self.update()
-            self.controller.staff_table.update()
+    def modeChanged(self, mode):
+        """只啟用目前生成模式用得到的設定"""
+        try:
+            self.time_budget.setEnabled(mode == '最佳化' or self.improve.isChecked())
+            self.restarts.setEnabled(mode == '多次隨機')
         except Exception as e:
-            print('FlowTable.py: generate', e)
+            print('FlowTable.py: modeChanged', e)
 
     def update(self):
         """根據controller.job_arr的資料重新整理table"""
         try:
-            self.systemChange = True
-            # 初始化
-            max_row = len(self.controller.first_half) + len(self.controller.second_half) + 2
-            self.table.setRowCount(0)
-            self.table.setRowCount(max_row+1)
-            for r in range(self.table.rowCount()):
-                for c in range(self.table.columnCount()):
-                    self.table.setItem(r, c, QTableWidgetItem())
-
-            # 填入表演順序
-            arr = self.controller.job_arr
-            fh = self.controller.first_half
-            sh = self.controller.second_half
-            self.table.setItem(0, 0, QTableWidgetItem("上半場預熱"))
-            self.table.setItem(len(fh)+1, 0, QTableWidgetItem("中場休息"))
-            self.table.setItem(len(fh)+2, 0, QTableWidgetItem("下半場預熱"))
-            row = 1
-            for name in fh.keys():
-                self.table.setItem(row, 0, QTableWidgetItem(name))
-                if row-1 > 0 :
-                    self.table.setItem(row-1, 1, QTableWidgetItem(name))
-                if row-2 > 0:
-                    self.table.setItem(row-2, 2, QTableWidgetItem(name))
-                row += 1
-            row += 2
-            for name in sh.keys():
-                self.table.setItem(row, 0, QTableWidgetItem(name))
-                if row-1 > len(fh)+2 :
-                    self.table.setItem(row-1, 1, QTableWidgetItem(name))
-                if row-2 > len(fh)+2:
-                    self.table.setItem(row-2, 2, QTableWidgetItem(name))
-                row += 1
-
-            # 設定表演名稱唯讀
-            for row in range(self.table.rowCount()):
-                for col in range(3):
-                    item = self.table.item(row, col)
-                    item.setFlags(item.flags() & ~Qt.ItemIsEditable)
-
-            # 填入工作人員
-            for row in range(len(arr)):
-                for col in range(len(arr[0])):
-                    new_r = row
-                    if row >= len(fh)+1:
-                        new_r = row + 1
-                    self.table.setItem(new_r, col+3, QTableWidgetItem(arr[row][col]))
-            self.systemChange = False
+            self.model.reset()
         except Exception as e:
             print("FlowTable.py: update", e)
 
+    def refresh(self, cells):
+        """
+        由controller的排程呼叫，重畫細流的格子
+        cells: [set] job_arr的 (row, col)，None時重畫整個表格 (表演順序要重新生成細流才會改變)
+        """
+        try:
+            if cells is not None:
+                self.model.refresh(cells)
+            elif self.model.rowCount():
+                self.model.dataChanged.emit(self.model.index(0, 0), self.model.index(self.model.rowCount()-1, self.model.columnCount()-1))
+        except Exception as e:
+            print('FlowTable.py: refresh', e)
+
     def check(self):
+        """列出衝突索引中每位工作人員與表演、場協或其他工作的衝突"""
         try:
-            staff_dic = self.controller.staff_dic
-            p_list = []
-            pre1_list = []
-            pre2_list = []
-            next_list = []
-            assist_list = []
-            pre1_a_list = []
-            for row in range(self.table.rowCount()):
-                p = self.table.item(row, 0).text()
-                pre1 = self.table.item(row, 1).text()
-                pre2 = self.table.item(row, 2).text()
-                for col in range(3, self.table.columnCount()):
-                    name = self.table.item(row, col).text()
-                    if not name:
+            with Stats.timer('check'):
+                lists = problems(self.controller.get_arranger())
+                text = ''
+                for c, names in lists.items():
+                    if not names:
                         continue
-                    performances = staff_dic[name]['performances']
-                    assistances = staff_dic[name]['assistances']
-                    if p in performances:
-                        p_list.append(name)
-                    if p in assistances:
-                        assist_list.append(name)
-                    if pre1 in performances:
-                        pre1_list.append(name)
-                    if pre1 in assistances:
-                        pre1_a_list.append(name)
-                    if pre2 in performances:
-                        pre2_list.append(name)
-                    if row-1 > 0:
-                        next = self.table.item(row-1, 0).text()
-                        if next in performances:
-                            next_list.append(name)
-            text = ''
-            if p_list:
-                text += '以下人員的 表演 與工作重疊了:\n'
-                text += ', '.join(p_list) + '\n\n'
-            if pre1_list:
-                text += '以下人員的 準備1 與工作重疊了:\n'
-                text += ', '.join(pre1_list) + '\n\n'
-            if pre2_list:
-                text += '以下人員的 準備2 與工作重疊了:\n'
-                text += ', '.join(pre2_list) + '\n\n'
-            if next_list:
-                text += '以下人員的 表演完下一場 與工作重疊了:\n'
-                text += ', '.join(next_list) + '\n\n'
-            if assist_list:
-                text += '以下人員的 場協 與工作重疊了:\n'
-                text += ', '.join(assist_list) + '\n\n'
-            if pre1_a_list:
-                text += '以下人員的 場協準備1 與工作重疊了:\n'
-                text += ', '.join(pre1_a_list) + '\n\n'
+                    if c == '連續三場工作':
+                        text += '以下人員 連續三場工作:\n'
+                    else:
+                        text += f'以下人員的 {c} 與工作重疊了:\n'
+                    text += ', '.join(names) + '\n\n'
             if not text:
                 text+= '沒有任何問題!'
             
@@ -611,49 +552,33 @@ class FlowTable(QWidget):
             print('FlowTable.py: check', e)
 
     def output(self):
+        """選擇路徑後在背景執行緒匯出Excel，按鈕上顯示進度"""
         try:
-            table_widget = self.table
-            row_count = table_widget.rowCount()
-            column_count = table_widget.columnCount()
-
-            # 取得表頭
-            headers = ['表演者', '準備一', '準備二', '闈場(1.2.3.4.5.6)', '左火區 / 右火區']
-
-            # 收集表格資料
-            data = []
-            for row in range(row_count):
-                if row == len(self.controller.first_half)+1:
-                    data.append(['中場休息'])
-                    continue
-                row_data = []
-                security = []
-                left_extinguish = []
-                right_extinguish = []
-                for col in range(column_count):
-                    item = table_widget.item(row, col)
-                    if col < 3:
-                        row_data.append(item.text() if item else "")
-                    elif col < 9:
-                        security.append(item.text() if item else "")
-                    elif col < 11:
-                        left_extinguish.append(item.text() if item else "")
-                    else:
-                        right_extinguish.append(item.text() if item else "")
-                security = '、'.join(security)
-                left_extinguish = '、'.join(left_extinguish)
-                right_extinguish = '、'.join(right_extinguish)
-                all_extinguish = left_extinguish + ' / ' + right_extinguish
-                row_data.append(security)
-                row_data.append(all_extinguish)
-                data.append(row_data)
-
-            # 建立 DataFrame 並匯出為 Excel
-            df = DataFrame(data, columns=headers)
-
-            # 選擇儲存檔案路徑
+            if self.exporter is not None and self.exporter.isRunning():
+                return
             file_path, _ = QFileDialog.getSaveFileName(None, "Save File", "output.xlsx", "Excel Files (*.xlsx)")
-            if file_path:
-                df.to_excel(file_path, index=False)
-                print(f"Table exported to {file_path}")
+            if not file_path:
+                return
+            # 在主執行緒複製一份資料，匯出時繼續編輯不影響輸出內容
+            self.exporter = ExportThread(
+                file_path,
+                dict.fromkeys(self.controller.first_half),
+                dict.fromkeys(self.controller.second_half),
+                [list(row) for row in self.controller.job_arr]
+            )
+            self.exporter.progress.connect(lambda percent: self.output_button.setText(f"{percent}%"))
+            self.exporter.failed.connect(lambda e: print('FlowTable.py: output', e))
+            self.exporter.finished.connect(self.outputFinished)
+            self.output_button.setEnabled(False)
+            self.exporter.start()
+        except Exception as e:
+            print('FlowTable.py: output', e)
+
+    def outputFinished(self):
+        try:
+            self.output_button.setText("輸出表格")
+            self.output_button.setEnabled(True)
+            if self.exporter.ok:
+                print(f"Table exported to {self.exporter.file_path}")
         except Exception as e:
-            print('FlowTable.py: output', e)
\ No newline at end of file
+            print('FlowTable.py: outputFinished', e)
\ No newline at end of file
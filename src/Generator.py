@@ -0,0 +1,72 @@
+"""
+生成細流及檢查的流程
+不依賴Qt，細流區及命令列共用，排班引擎 (numpy) 在第一次生成時才載入
+"""
+import Stats
+
+MODES = ['快速', '最佳化', '多次隨機', '局部重排']
+
+
+def pins(job_arr, pinned):
+    """回傳鎖定格子的內容 {(row, col): 名字}，已經清空的格子略過"""
+    result = {}
+    for row, col in pinned:
+        if row < len(job_arr) and col < len(job_arr[row]) and job_arr[row][col]:
+            result[(row, col)] = job_arr[row][col]
+    return result
+
+
+def arrange(first_half, second_half, staff_dic, mode='快速', job_arr=None, pinned=(), old_input=None,
+            time_budget=5, restarts=64, improve=False, seed=None, workers=None):
+    """
+    依mode生成細流，回傳 (Arranger, 空格原因)，空格原因見Arranger.report
+    最佳化模式會在Arranger.optimal記錄是否證明為最佳解
+    job_arr, pinned: 目前的細流及鎖定的格子 ((row, col) 或json存檔中的[row, col])，鎖定的格子不會更動，局部重排時保留其他格子
+    old_input: 上次生成時snapshot的結果，局部重排比對用，None時只修正不符合限制的格子
+    seed: 隨機種子，快速模式時打亂同分人員的順序
+    workers: 多次隨機使用的行程數，None時使用所有核心
+    """
+    from Arranger import Arranger, best_of, snapshot, repair
+    from Solver import Solver
+    from LocalSearch import LocalSearch
+    job_arr = job_arr or [[]]
+    pinned_cells = pins(job_arr, pinned)
+    optimal = None
+
+    with Stats.timer('generate.arrange'):
+        if mode == '局部重排':
+            if old_input is None: # 沒有上次生成的紀錄，只修正不符合限制的格子
+                old_input = snapshot(first_half, second_half, staff_dic)
+            arranger, _ = repair(old_input, first_half, second_half, staff_dic, job_arr, {tuple(p) for p in pinned})
+            greedy = arranger
+        elif mode == '最佳化':
+            solver = Solver(first_half, second_half, staff_dic, time_budget, pins=pinned_cells)
+            arranger = Arranger(first_half, second_half, staff_dic, solver.solve(), pins=pinned_cells)
+            greedy = solver.greedy # 最佳化不逐條套用排班規則，回報起點的一般排班
+            optimal = solver.optimal
+        else:
+            if mode == '多次隨機': # 在這個行程重排一次最好的seed，才有空格原因
+                seed = best_of(first_half, second_half, staff_dic, restarts, seed=seed, workers=workers, pins=pinned_cells)
+            arranger = Arranger(first_half, second_half, staff_dic, seed=seed, pins=pinned_cells)
+            arranger.generate()
+            greedy = arranger
+    rejections = greedy.report() # 局部優化前的空格原因
+    if improve:
+        with Stats.timer('generate.improve'):
+            arr = LocalSearch(first_half, second_half, staff_dic, arranger.arr, time_budget=time_budget,
+                              seed=seed, pins=arranger.pins()).run()
+            arranger = Arranger(first_half, second_half, staff_dic, arr, pins=arranger.pins())
+    arranger.optimal = optimal
+    return arranger, rejections
+
+
+def problems(arranger):
+    """
+    自動檢查，回傳 {衝突種類: [有衝突的人員]}，依CONFLICTS的順序排列
+    """
+    from Arranger import CONFLICTS
+    lists = {c: [] for c in CONFLICTS}
+    for (row, col), found in sorted(arranger.conflict_index().items()):
+        for c in found:
+            lists[c].append(arranger.arr[row][col])
+    return lists
@@ -0,0 +1,86 @@
+from PyQt5.QtWidgets import QTableWidget
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor, QBrush
+import Stats
+
+BRUSHES = {} # 顏色 -> QBrush，同一種顏色只建立一次
+
+
+def brush(color):
+    if color not in BRUSHES:
+        BRUSHES[color] = QBrush(QColor(color))
+    return BRUSHES[color]
+
+
+class Highlight:
+    """
+    表格的高亮狀態，三個表格共用
+    只記錄目前高亮的格子 {(row, col): 顏色}，清除時只處理這些格子
+    QTableWidget直接設定儲存格背景，其他model在BackgroundRole時呼叫background()
+    每次修改只發出一次dataChanged，並依連續的row分段重畫
+    """
+    def __init__(self, table):
+        self.table = table
+        self.cells = {}
+
+    def background(self, row, col):
+        """給model的BackgroundRole使用，沒有高亮時回傳None"""
+        color = self.cells.get((row, col))
+        return brush(color) if color else None
+
+    def paint(self, colors):
+        """
+        高亮格子，已經是同樣顏色的格子不重畫
+        colors: [dict] {(row, col): 顏色}，顏色為None時清除該格
+        """
+        changed = {}
+        for coor, color in colors.items():
+            if self.cells.get(coor) == color:
+                continue
+            changed[coor] = color
+            if color is None:
+                del self.cells[coor]
+            else:
+                self.cells[coor] = color
+        if changed:
+            with Stats.timer('highlight'):
+                self.render(changed)
+            Stats.count('highlight.cells', len(changed))
+
+    def clear(self):
+        """清除所有高亮的格子"""
+        self.paint(dict.fromkeys(self.cells))
+
+    def reset(self):
+        """表格重新建立後呼叫，捨棄高亮狀態但不重畫"""
+        self.cells = {}
+
+    def render(self, changed):
+        model = self.table.model()
+        if isinstance(self.table, QTableWidget):
+            model.blockSignals(True) # 避免每一格都觸發cellChanged及重畫
+            try:
+                for (row, col), color in changed.items():
+                    item = self.table.item(row, col)
+                    if item:
+                        item.setBackground(brush(color) if color else QBrush())
+            finally:
+                model.blockSignals(False)
+        span = {} # 每個row變動的 (最小col, 最大col)
+        for row, col in changed:
+            lo, hi = span.get(row, (col, col))
+            span[row] = (min(lo, col), max(hi, col))
+        rows = sorted(span)
+        start = 0
+        blocked = self.table.blockSignals(True) # QTableWidget收到單格的dataChanged時會發出cellChanged
+        try:
+            for i, row in enumerate(rows):
+                if i + 1 < len(rows) and rows[i + 1] == row + 1: # 連續的row合併成一段
+                    continue
+                group = rows[start:i + 1]
+                left = min(span[r][0] for r in group)
+                right = max(span[r][1] for r in group)
+                model.dataChanged.emit(model.index(group[0], left), model.index(row, right), [Qt.BackgroundRole])
+                start = i + 1
+        finally:
+            self.table.blockSignals(blocked)
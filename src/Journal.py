@@ -0,0 +1,118 @@
+"""
+編輯紀錄
+每次修改資料時在檔案尾端加上一行json，自動存檔完成後刪掉已經存進檔案的紀錄
+程式異常結束時，讀取自動存檔再依序套用之後的紀錄即可復原
+寫入後由呼叫端定時呼叫sync寫到磁碟，斷電時最多遺失最後一次sync之後的紀錄
+"""
+import json
+import os
+import threading
+
+
+class Journal:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.lock = threading.Lock() # 自動存檔在背景執行緒整理紀錄
+        self.file = None
+        self.count = 0 # 目前紀錄的行數
+        self.unsynced = False # 是否有還沒寫到磁碟的紀錄
+
+    def append(self, entry):
+        """加上一筆紀錄，entry需包含v (資料版本) 及op (操作種類)"""
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.file_path, 'a', encoding='utf-8')
+            self.file.write(line)
+            self.file.flush()
+            self.count += 1
+            self.unsynced = True
+
+    def sync(self):
+        """將紀錄寫到磁碟 (fsync)，只flush時斷電仍可能遺失作業系統快取中的資料"""
+        with self.lock:
+            if self.file is not None and self.unsynced:
+                os.fsync(self.file.fileno())
+            self.unsynced = False
+
+    def entries(self):
+        """讀取所有紀錄，最後一行寫到一半時略過"""
+        if not os.path.exists(self.file_path):
+            return []
+        result = []
+        with open(self.file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    result.append(json.loads(line))
+                except ValueError:
+                    break
+        return result
+
+    def compact(self, version):
+        """刪掉版本不超過version的紀錄 (已經存進自動存檔)"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            keep = [e for e in self.entries() if e['v'] > version]
+            tmp_path = self.file_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for e in keep:
+                    f.write(json.dumps(e, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.file_path)
+            self.count = len(keep)
+            self.unsynced = False
+
+    def clear(self):
+        """正常關閉時刪除紀錄"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            if os.path.exists(self.file_path):
+                os.remove(self.file_path)
+            self.count = 0
+            self.unsynced = False
+
+
+def apply(state, entry):
+    """
+    將一筆紀錄套用到存檔資料上
+    state: [dict] first_half, second_half, staff_dic, job_arr, pinned, unique_id
+    """
+    op = entry['op']
+    if op == 'load': # 讀取檔案，整份資料
+        state.clear()
+        state.update(entry['state'])
+    elif op == 'cell': # 修改細流的一格
+        state['job_arr'][entry['row']][entry['col']] = entry['name']
+        if not entry['name'] and [entry['row'], entry['col']] in state['pinned']:
+            state['pinned'].remove([entry['row'], entry['col']])
+    elif op == 'pin': # 鎖定或解除鎖定
+        coor = [entry['row'], entry['col']]
+        if entry['pinned'] and coor not in state['pinned']:
+            state['pinned'].append(coor)
+        elif not entry['pinned'] and coor in state['pinned']:
+            state['pinned'].remove(coor)
+    elif op == 'job_arr': # 生成細流
+        state['job_arr'] = entry['job_arr']
+        state['pinned'] = entry['pinned']
+    elif op == 'staff': # 新增或修改一位工作人員，data為None時刪除
+        if entry['data'] is None:
+            state['staff_dic'].pop(entry['name'], None)
+        else:
+            state['staff_dic'][entry['name']] = entry['data']
+        state['unique_id'] = entry['unique_id']
+    elif op == 'rename_staff':
+        staff_dic = state['staff_dic']
+        staff_dic[entry['new']] = staff_dic.pop(entry['old'])
+    elif op == 'performance': # 新增或修改一個表演
+        state[entry['half']][entry['name']] = entry['data']
+    elif op == 'rename_performance':
+        half = state[entry['half']]
+        half[entry['new']] = half.pop(entry['old'])
+    elif op == 'halves': # 表演順序改變或刪除表演
+        state['first_half'] = entry['first_half']
+        state['second_half'] = entry['second_half']
@@ -0,0 +1,182 @@
+"""
+局部優化
+從現有的細流出發，以模擬退火反覆嘗試 補空格、換人、搬移、交換 等小修改
+每次修改只計算分數的變化量，扣分計算方式與Arranger.penalty相同
+已經達到扣分下限時提早結束；連續patience次修改都沒有找到更好的細流時直接降到最低溫，再沒有進步就結束
+"""
+import math
+import time
+import numpy as np
+from Arranger import Arranger, COLS, FIRE_COLS, BUSY, PENALTY_EMPTY, PENALTY_FIRE, PENALTY_SOFT
+
+
+class LocalSearch:
+    def __init__(self, first_half, second_half, staff_dic, job_arr, iterations=200000, time_budget=5, seed=None, pins=None,
+                 patience=20000):
+        self.arranger = Arranger(first_half, second_half, staff_dic, job_arr, pins=pins)
+        self.iterations = iterations
+        self.time_budget = time_budget
+        self.patience = patience
+        self.rng = np.random.default_rng(seed)
+        a = self.arranger
+        # 每人每個時段的工作扣分，不可工作的時段為None
+        self.soft = [[None if code == BUSY else PENALTY_SOFT.get(int(code), 0) for code in row] for row in a.base.tolist()]
+
+    def lower_bound(self):
+        """
+        扣分的下限: 沒有準備、剛下場的工作，工作量在上限內盡量平均分配
+        全部人的上限加起來不夠填滿時，多出來的格子一定是空格
+        """
+        total = self.arranger.max_row * COLS
+        limits = sorted(int(x) for x in self.arranger.limit)
+        if sum(limits) <= total:
+            return PENALTY_EMPTY * (total - sum(limits)) + sum(x * x for x in limits)
+        spread, left = 0, total
+        for k, x in enumerate(limits):
+            q, r = divmod(left, len(limits) - k)
+            if x > q: # 剩下的人上限都夠，平均分配
+                return spread + r * (q + 1) ** 2 + (len(limits) - k - r) * q * q
+            spread += x * x
+            left -= x
+        return spread
+
+    def empty_cost(self, col):
+        return PENALTY_EMPTY + (PENALTY_FIRE if col in FIRE_COLS else 0)
+
+    def can_take(self, i, row, col):
+        """第i個人能否接下 (row, col) 的工作"""
+        a = self.arranger
+        if self.soft[i][row] is None or a.assigned[i, row]:
+            return False
+        if a.jobs[i] >= a.limit[i]:
+            return False
+        if col in FIRE_COLS and not a.fire_ok[i]:
+            return False
+        return not a.consecutive(i, row)
+
+    def fill(self, row, col):
+        """空格 -> 隨機一人"""
+        a = self.arranger
+        i = int(self.rng.integers(len(a.names)))
+        if not self.can_take(i, row, col):
+            return None
+        delta = self.soft[i][row] + 2 * int(a.jobs[i]) + 1 - self.empty_cost(col)
+        return delta, lambda: a.assign(i, row, col)
+
+    def replace(self, row, col):
+        """有人的格子 -> 換成另一人"""
+        a = self.arranger
+        i = a.index.get(a.arr[row][col])
+        k = int(self.rng.integers(len(a.names)))
+        if i is None or k == i:
+            return None
+        a.unassign(row, col)
+        ok = self.can_take(k, row, col)
+        a.assign(i, row, col)
+        if not ok:
+            return None
+        delta = self.soft[k][row] - self.soft[i][row] + 2 * int(a.jobs[k]) + 1 - (2 * int(a.jobs[i]) - 1)
+
+        def do():
+            a.unassign(row, col)
+            a.assign(k, row, col)
+        return delta, do
+
+    def relocate(self, row, col, row2, col2):
+        """(row, col) 的人搬到空格 (row2, col2)"""
+        a = self.arranger
+        i = a.index.get(a.arr[row][col])
+        if i is None:
+            return None
+        a.unassign(row, col)
+        ok = self.can_take(i, row2, col2)
+        a.assign(i, row, col)
+        if not ok:
+            return None
+        delta = (self.empty_cost(col) - self.soft[i][row]) - (self.empty_cost(col2) - self.soft[i][row2])
+
+        def do():
+            a.unassign(row, col)
+            a.assign(i, row2, col2)
+        return delta, do
+
+    def swap(self, row, col, row2, col2):
+        """交換兩個不同時段的人"""
+        a = self.arranger
+        i = a.index.get(a.arr[row][col])
+        k = a.index.get(a.arr[row2][col2])
+        if i is None or k is None or i == k or row == row2:
+            return None
+        a.unassign(row, col)
+        a.unassign(row2, col2)
+        ok = self.can_take(i, row2, col2)
+        if ok:
+            a.assign(i, row2, col2)
+            ok = self.can_take(k, row, col)
+            a.unassign(row2, col2)
+        a.assign(i, row, col)
+        a.assign(k, row2, col2)
+        if not ok:
+            return None
+        delta = self.soft[i][row2] + self.soft[k][row] - self.soft[i][row] - self.soft[k][row2]
+
+        def do():
+            a.unassign(row, col)
+            a.unassign(row2, col2)
+            a.assign(i, row2, col2)
+            a.assign(k, row, col)
+        return delta, do
+
+    def propose(self):
+        """隨機選一個修改，回傳 (分數變化, 執行)，不可行時回傳None"""
+        a = self.arranger
+        row = int(self.rng.integers(a.max_row))
+        col = int(self.rng.integers(COLS))
+        if (row, col) in a.pinned: # 鎖定的格子不動
+            return None
+        if not a.arr[row][col]:
+            return self.fill(row, col)
+        if self.rng.random() < 0.3:
+            return self.replace(row, col)
+        row2 = int(self.rng.integers(a.max_row))
+        col2 = int(self.rng.integers(COLS))
+        if (row2, col2) in a.pinned:
+            return None
+        if a.arr[row2][col2]:
+            return self.swap(row, col, row2, col2)
+        return self.relocate(row, col, row2, col2)
+
+    def run(self, start_temp=50.0, end_temp=0.5):
+        """執行模擬退火，次數或時間用完、達到扣分下限或太久沒有進步時回傳過程中扣分最少的job_arr"""
+        a = self.arranger
+        start = time.perf_counter()
+        current = a.penalty()
+        best, best_arr = current, [list(row) for row in a.arr]
+        bound = self.lower_bound()
+        improved = 0 # 上次找到更好細流的次數
+        cold = False
+        progress = 0.0
+        for step in range(self.iterations):
+            if best <= bound:
+                break
+            if step % 256 == 0:
+                # 依次數或時間中先用完的一個決定降溫進度
+                progress = max(step / self.iterations, (time.perf_counter() - start) / self.time_budget)
+                if progress >= 1:
+                    break
+            if step - improved >= self.patience:
+                if cold: # 降到最低溫後仍然沒有進步
+                    break
+                cold, improved = True, step # 太久沒有進步時直接降到最低溫，只接受小幅變差的修改
+            temp = end_temp if cold else start_temp * (end_temp / start_temp) ** progress
+            move = self.propose()
+            if move is None:
+                continue
+            delta, do = move
+            if delta <= 0 or self.rng.random() < math.exp(-delta / temp):
+                do()
+                current += delta
+                if current < best:
+                    best, best_arr = current, [list(row) for row in a.arr]
+                    improved = step
+        return best_arr
@@ -2,7 +2,8 @@ from PyQt5.QtWidgets import (QTableWidget, QWidget, QVBoxLayout, QHBoxLayout, QL
                             QDialog, QFormLayout, QLineEdit, QSpinBox, QDialogButtonBox, QMessageBox,
                             QTableWidgetItem, QMenu, QAction)
 from PyQt5.QtCore import Qt, QMimeData
-from PyQt5.QtGui import QColor, QDrag
+from PyQt5.QtGui import QDrag
+from Highlight import Highlight
 
 class CustomTable(QTableWidget):
     def __init__(self, parent, controller, row, col):
@@ -53,8 +54,10 @@ class CustomTable(QTableWidget):
                 for s in performers + assistants:
                     if s in staff_dic and not staff_dic[s]['performances'] and not staff_dic[s]['assistances']:
                         staff_dic.pop(s)
+                self.controller.record_staff(*[s for s in set(performers + assistants) if s])
                 self.removeRow(row)
-            self.controller.staff_table.update()
+            self.controller.invalidate()
+            self.controller.schedule(self.controller.staff_table)
             self.parent().updateFromTable()
         except Exception as e:
             print('PerformanceTable.py: deleteSelectedRows', e)
@@ -119,7 +122,7 @@ class PerformanceTable(QWidget):
             self.second_half.cellPressed.connect(lambda row, col: self.pressed(row, col, 'second'))
             self.second_half.cellChanged.connect(lambda row, col: self.changed(row, col, 'second'))
 
-            self.highlighted = []
+            self.highlights = {'first': Highlight(self.first_half), 'second': Highlight(self.second_half)}
 
             # Title & Button
             title1 = QLabel("上半場")
@@ -206,73 +209,38 @@ class PerformanceTable(QWidget):
     def highlightPerformer(self, name):
         """給予表演者名稱，高亮該表演者對應的表演及場協"""
         try:
-            self.systemChange = True
             staff_dic = self.controller.staff_dic
             if name not in staff_dic:
                 return
-            for p in staff_dic[name]['performances']: # 表演設為黃色
-                found = False
-                for row in range(self.first_half.rowCount()):
-                    if p == self.first_half.item(row, 0).text():
-                        self.first_half.item(row, 0).setBackground(QColor("#ffffaa"))
-                        self.highlighted.append((row, 0, 'first'))
-                        found = True
-                        break
-                if found:
-                    continue
-                for row in range(self.second_half.rowCount()):
-                    if p == self.second_half.item(row, 0).text():
-                        self.second_half.item(row, 0).setBackground(QColor("#ffffaa"))
-                        self.highlighted.append((row, 0, 'second'))
-                        break
-            for p in staff_dic[name]['assistances']: # 場協設為橘色
-                found = False
-                for row in range(self.first_half.rowCount()):
-                    if p == self.first_half.item(row, 0).text():
-                        self.first_half.item(row, 0).setBackground(QColor("#ffaf60"))
-                        self.highlighted.append((row, 0, 'first'))
-                        found = True
-                        break
-                if found:
-                    continue
-                for row in range(self.second_half.rowCount()):
-                    if p == self.second_half.item(row, 0).text():
-                        self.second_half.item(row, 0).setBackground(QColor("#ffaf60"))
-                        self.highlighted.append((row, 0, 'second'))
-                        break
-            self.systemChange = False
+            cells = {'first': {}, 'second': {}}
+            perf_index = self.controller.perf_index
+            for key, color in (('performances', "#ffffaa"), ('assistances', "#ffaf60")): # 表演設為黃色，場協設為橘色
+                for p in staff_dic[name][key]:
+                    if p in perf_index:
+                        half, row = perf_index[p]
+                        cells[half][(row, 0)] = color
+            for half, colors in cells.items():
+                self.highlights[half].paint(colors)
         except Exception as e:
             print('PerformanceTable.py: highlight performer', e)
 
     def highlightPerformance(self, row):
         """給予表演順序，高亮該表演"""
         try:
-            self.systemChange = True
             if row == 0 or row == len(self.controller.first_half)+1 or row == len(self.controller.first_half)+2:
                 return
             if row <= self.first_half.rowCount():
-                row -= 1
-                self.first_half.item(row, 0).setBackground(QColor("#ffffaa"))
-                self.highlighted.append((row, 0, 'first'))
+                self.highlights['first'].paint({(row-1, 0): "#ffffaa"})
             else:
-                row -= self.first_half.rowCount()+3
-                self.second_half.item(row, 0).setBackground(QColor("#ffffaa"))
-                self.highlighted.append((row, 0, 'second'))
-            self.systemChange = False
+                self.highlights['second'].paint({(row-self.first_half.rowCount()-3, 0): "#ffffaa"})
         except Exception as e:
             print('PerformanceTable.py: highlight performance', e)
 
-        
     def clearHighlight(self):
         """清除上次高亮顯示的物件"""
         try:
-            self.systemChange = True
-            for coor in self.highlighted:
-                if coor[2] == 'first':
-                    self.first_half.item(coor[0], coor[1]).setBackground(QColor('white'))
-                if coor[2] == 'second':
-                    self.second_half.item(coor[0], coor[1]).setBackground(QColor('white'))
-            self.systemChange = False
+            for highlight in self.highlights.values():
+                highlight.clear()
         except Exception as e:
             print('PerformanceTable.py: clearHighlight', e)
         
@@ -292,9 +260,11 @@ class PerformanceTable(QWidget):
                     dic = self.controller.second_half
 
                 dic[values['name']] = {'performers': values['performers'], 'assistants': values['assistants'], 'time': values['time']}
+                self.controller.invalidate()
+                self.controller.record('performance', half=half+'_half', name=values['name'], data=dic[values['name']])
                 self.controller.staff_table.addStaffList(values['performers'], values['name'], 'performer')
                 self.controller.staff_table.addStaffList(values['assistants'], values['name'], 'assistant')
-                self.update()
+                self.controller.schedule(self)
 
         except Exception as e:
             print('PerformanceTable.py: addPerformance', e)
@@ -306,18 +276,29 @@ class PerformanceTable(QWidget):
             print('PerformanceTable.py: changeDefaultTime', e)
 
     def numberPerformance(self):
+        """依順序編號表演，並重建表演名稱及編號的索引"""
         try:
+            perf_index = self.controller.perf_index = {}
+            num_index = self.controller.num_index = {}
             i = 1
-            for name, dic in self.controller.first_half.items():
+            for row, (name, dic) in enumerate(self.controller.first_half.items()):
                 dic['num'] = i
+                perf_index[name] = ('first', row)
+                num_index[i] = name
                 i += 1
             i += 1
-            for name, dic in self.controller.second_half.items():
+            for row, (name, dic) in enumerate(self.controller.second_half.items()):
                 dic['num'] = i
+                perf_index[name] = ('second', row)
+                num_index[i] = name
                 i += 1
         except Exception as e:
             print('PerformanceTable.py: numberPerformance', e)
 
+    def refresh(self, rows):
+        """由controller的排程呼叫，表演表格一律整個重新整理"""
+        self.update()
+
     def update(self):
         """
         根據controller.first_half和controller.second_half中的資料
@@ -326,6 +307,8 @@ class PerformanceTable(QWidget):
         try:
             self.systemChange = True
             self.numberPerformance()
+            for highlight in self.highlights.values():
+                highlight.reset()
             t = self.first_half
             t.setRowCount(0)
             row = 0
@@ -369,6 +352,8 @@ class PerformanceTable(QWidget):
             self.controller.first_half = fillIn(self.first_half)
             self.controller.second_half = fillIn(self.second_half)
             self.numberPerformance()
+            self.controller.invalidate()
+            self.controller.record('halves', first_half=self.controller.first_half, second_half=self.controller.second_half)
             
         except Exception as e:
             print('PerformanceTable.py: updateFromTable', e)
@@ -392,12 +377,14 @@ class PerformanceTable(QWidget):
                 staff_table = self.controller.staff_table
                 match col:
                     case 0:
-                        for old_name, dic in half.items():
-                            if dic['num'] == num:
-                                staff_table.removeStaffList(half[old_name]['performers'], old_name, 'performer')
-                                staff_table.removeStaffList(half[old_name]['assistants'], old_name, 'assistant')
-                                break
+                        old_name = self.controller.num_index[num]
+                        staff_table.removeStaffList(half[old_name]['performers'], old_name, 'performer')
+                        staff_table.removeStaffList(half[old_name]['assistants'], old_name, 'assistant')
                         half[name] = half.pop(old_name)
+                        self.controller.record('rename_performance', half=half_str+'_half', old=old_name, new=name)
+                        self.controller.num_index[num] = name
+                        self.controller.perf_index[name] = self.controller.perf_index.pop(old_name)
+                        self.controller.invalidate()
                         staff_table.addStaffList(half[name]['performers'], name, 'performer')
                         staff_table.addStaffList(half[name]['assistants'], name, 'assistant')
                     case 1:
@@ -411,6 +398,7 @@ class PerformanceTable(QWidget):
                     case 3:
                         time = int(table.item(row, col).text())
                         half[name]['time'] = time
+                        self.controller.record('performance', half=half_str+'_half', name=name, data=half[name])
         except Exception as e:
             print('PerformanceTable.py: changed', e)
 
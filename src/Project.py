@@ -0,0 +1,170 @@
+"""
+SQLite專案檔
+一個檔案可以存放多場演出 (shows)，讀取時只載入選擇的那一場
+存檔時只寫入和檔案內容不同的資料列，整次存檔在同一個交易中完成
+"""
+import json
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shows (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    unique_id INTEGER NOT NULL DEFAULT 0,
+    rows INTEGER NOT NULL DEFAULT 1,
+    cols INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS performances (
+    show_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    half TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    performers TEXT NOT NULL,
+    assistants TEXT NOT NULL,
+    PRIMARY KEY (show_id, name)
+);
+CREATE INDEX IF NOT EXISTS performances_slot ON performances (show_id, half, seq);
+CREATE TABLE IF NOT EXISTS staff (
+    show_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    num INTEGER,
+    priority TEXT NOT NULL,
+    extinguish TEXT NOT NULL,
+    PRIMARY KEY (show_id, name)
+);
+CREATE INDEX IF NOT EXISTS staff_num ON staff (show_id, num);
+CREATE TABLE IF NOT EXISTS memberships (
+    show_id INTEGER NOT NULL,
+    staff TEXT NOT NULL,
+    performance TEXT NOT NULL,
+    role TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (show_id, staff, performance, role)
+);
+CREATE INDEX IF NOT EXISTS memberships_performance ON memberships (show_id, performance);
+CREATE TABLE IF NOT EXISTS assignments (
+    show_id INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    col INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    pinned INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (show_id, row, col)
+);
+CREATE INDEX IF NOT EXISTS assignments_name ON assignments (show_id, name);
+"""
+
+# 資料表 -> (主鍵欄位, 其他欄位)，不含show_id
+TABLES = {
+    'performances': (('name',), ('half', 'seq', 'time', 'performers', 'assistants')),
+    'staff': (('name',), ('seq', 'num', 'priority', 'extinguish')),
+    'memberships': (('staff', 'performance', 'role'), ('seq',)),
+    'assignments': (('row', 'col'), ('name', 'pinned')),
+}
+ROLES = {'performer': 'performances', 'assistant': 'assistances'} # memberships的role -> 工作人員資料的欄位
+
+
+class Project:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.conn = sqlite3.connect(file_path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def shows(self):
+        """回傳檔案中所有演出的名稱"""
+        return [name for name, in self.conn.execute("SELECT name FROM shows ORDER BY id")]
+
+    def load(self, show):
+        """讀取一場演出，格式與json存檔相同"""
+        show_id, unique_id, rows, cols = self.conn.execute(
+            "SELECT id, unique_id, rows, cols FROM shows WHERE name = ?", (show,)).fetchone()
+
+        halves = {'first_half': {}, 'second_half': {}}
+        for name, half, time, performers, assistants in self.conn.execute(
+                "SELECT name, half, time, performers, assistants FROM performances WHERE show_id = ? ORDER BY half, seq",
+                (show_id,)):
+            halves[half][name] = {'performers': json.loads(performers), 'assistants': json.loads(assistants), 'time': time}
+
+        staff_dic = {}
+        for name, num, priority, extinguish in self.conn.execute(
+                "SELECT name, num, priority, extinguish FROM staff WHERE show_id = ? ORDER BY seq", (show_id,)):
+            staff_dic[name] = {'priority': priority, 'performances': [], 'assistances': [],
+                               'extinguish': extinguish, 'num': num}
+        for staff, performance, role in self.conn.execute(
+                "SELECT staff, performance, role FROM memberships WHERE show_id = ? ORDER BY staff, seq", (show_id,)):
+            staff_dic[staff][ROLES[role]].append(performance)
+
+        job_arr = [["" for _ in range(cols)] for _ in range(rows)]
+        pinned = []
+        for row, col, name, pin in self.conn.execute(
+                "SELECT row, col, name, pinned FROM assignments WHERE show_id = ?", (show_id,)):
+            job_arr[row][col] = name
+            if pin:
+                pinned.append([row, col])
+
+        return {
+            "first_half": halves['first_half'],
+            "second_half": halves['second_half'],
+            "staff_dic": staff_dic,
+            "job_arr": job_arr,
+            "pinned": sorted(pinned),
+            'unique_id': unique_id
+        }
+
+    def save(self, show, data):
+        """
+        將一場演出寫入檔案，只新增、修改或刪除有變動的資料列
+        data: [dict] 格式與json存檔相同
+        """
+        job_arr = data['job_arr']
+        pinned = set(map(tuple, data['pinned']))
+        rows = {
+            'performances': [
+                (name, half, seq, p['time'], json.dumps(p['performers'], ensure_ascii=False),
+                 json.dumps(p['assistants'], ensure_ascii=False))
+                for half in ('first_half', 'second_half')
+                for seq, (name, p) in enumerate(data[half].items())
+            ],
+            'staff': [(name, seq, s.get('num'), s['priority'], s['extinguish'])
+                      for seq, (name, s) in enumerate(data['staff_dic'].items())],
+            'memberships': [
+                (name, p, role, seq)
+                for name, s in data['staff_dic'].items()
+                for role, key in ROLES.items()
+                for seq, p in enumerate(s[key])
+            ],
+            'assignments': [
+                (row, col, name, int((row, col) in pinned))
+                for row, line in enumerate(job_arr)
+                for col, name in enumerate(line) if name
+            ],
+        }
+
+        with self.conn: # 同一個交易，失敗時整次存檔都不生效
+            self.conn.execute(
+                "INSERT INTO shows (name, unique_id, rows, cols) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET unique_id = excluded.unique_id, rows = excluded.rows, cols = excluded.cols",
+                (show, data['unique_id'], len(job_arr), max((len(line) for line in job_arr), default=0)))
+            show_id, = self.conn.execute("SELECT id FROM shows WHERE name = ?", (show,)).fetchone()
+            for table, new_rows in rows.items():
+                self.sync(show_id, table, new_rows)
+
+    def sync(self, show_id, table, new_rows):
+        """比對檔案中的資料列，只寫入不同的列並刪除已經不存在的列"""
+        keys, values = TABLES[table]
+        n = len(keys)
+        columns = ', '.join(keys + values)
+        old = {row[:n]: row[n:] for row in self.conn.execute(f"SELECT {columns} FROM {table} WHERE show_id = ?", (show_id,))}
+        new = {row[:n]: row[n:] for row in new_rows}
+        upsert = [(show_id,) + key + value for key, value in new.items() if old.get(key) != value]
+        delete = [(show_id,) + key for key in old if key not in new]
+        if upsert:
+            marks = ', '.join('?' * (n + len(values) + 1))
+            self.conn.executemany(f"INSERT OR REPLACE INTO {table} (show_id, {columns}) VALUES ({marks})", upsert)
+        if delete:
+            where = ' AND '.join(f"{k} = ?" for k in keys)
+            self.conn.executemany(f"DELETE FROM {table} WHERE show_id = ? AND {where}", delete)
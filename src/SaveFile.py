@@ -0,0 +1,59 @@
+"""
+存檔格式
+不依賴Qt，主程式及命令列共用
+"""
+import json
+import os
+
+SCHEMA_VERSION = 2 # 存檔格式版本，1為會存下衍生資料的舊格式
+# 存檔只保留的原始資料，權重、編號、工作數量等由Arranger及表格重新計算
+PERFORMANCE_KEYS = ('performers', 'assistants', 'time')
+STAFF_KEYS = ('priority', 'performances', 'assistances', 'extinguish', 'num')
+
+
+def write_json(file_path, data, indent=None):
+    """先寫入暫存檔再取代原檔，寫到一半中斷時原檔仍然完整"""
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def read_json(file_path):
+    """讀取json存檔並轉為目前的格式"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return migrate(json.load(f))
+
+
+def source(dic, keys):
+    """只取出dic中要存檔的欄位"""
+    return {key: dic[key] for key in keys if key in dic}
+
+
+def dump(first_half, second_half, staff_dic, job_arr, pinned, unique_id):
+    """要存檔的資料，只包含原始資料"""
+    return {
+        'schema': SCHEMA_VERSION,
+        "first_half": {name: source(p, PERFORMANCE_KEYS) for name, p in first_half.items()},
+        "second_half": {name: source(p, PERFORMANCE_KEYS) for name, p in second_half.items()},
+        "staff_dic": {name: source(s, STAFF_KEYS) for name, s in staff_dic.items()},
+        "job_arr": job_arr,
+        "pinned": sorted(pinned),
+        'unique_id': unique_id
+    }
+
+
+def migrate(data):
+    """將舊版本的存檔轉為目前的格式，舊版本存有空閒程度、工作位置等衍生資料"""
+    schema = data.get('schema', 1)
+    if schema > SCHEMA_VERSION:
+        raise ValueError(f'存檔格式版本{schema}比程式新，請更新程式')
+    if schema < 2:
+        for half in ('first_half', 'second_half'):
+            data[half] = {name: source(p, PERFORMANCE_KEYS) for name, p in data[half].items()}
+        data['staff_dic'] = {name: source(s, STAFF_KEYS) for name, s in data['staff_dic'].items()}
+        data.setdefault('pinned', [])
+    data['schema'] = SCHEMA_VERSION
+    return data
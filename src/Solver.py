@@ -0,0 +1,286 @@
+"""
+最佳化排班
+先放寬「不可連續三場工作」，以最大流求出最多能填滿幾格 (上界)，
+再以分支界限法處理連續工作，時間預算用完時回傳目前找到的最佳細流
+最大流的每個階段之間都會檢查時間，大型演出也不會超過時間預算太多
+只使用Python及numpy，不需要外部求解器
+"""
+import time
+from collections import deque
+import numpy as np
+from Arranger import Arranger, COLS, FIRE_COLS, FREE
+
+
+class Timeout(Exception):
+    """時間預算用完"""
+
+
+def check(deadline):
+    if deadline is not None and time.perf_counter() > deadline:
+        raise Timeout()
+
+
+class MaxFlow:
+    """Dinic最大流，反向邊的編號為正向邊 ^ 1"""
+    def __init__(self):
+        self.head = []
+        self.to = []
+        self.cap = []
+
+    def node(self):
+        self.head.append([])
+        return len(self.head) - 1
+
+    def edge(self, u, v, cap):
+        e = len(self.to)
+        self.to += [v, u]
+        self.cap += [cap, 0]
+        self.head[u].append(e)
+        self.head[v].append(e + 1)
+        return e
+
+    def flow(self, e):
+        """正向邊e目前的流量"""
+        return self.cap[e ^ 1]
+
+    def run(self, s, t, deadline=None):
+        """
+        從目前的殘餘網路繼續擴充，回傳增加的流量
+        deadline: [float] time.perf_counter的時間，超過時丟出Timeout
+        """
+        total = 0
+        while True:
+            check(deadline)
+            level = [-1] * len(self.head)
+            level[s] = 0
+            queue = deque([s])
+            while queue:
+                u = queue.popleft()
+                for e in self.head[u]:
+                    v = self.to[e]
+                    if self.cap[e] and level[v] < 0:
+                        level[v] = level[u] + 1
+                        queue.append(v)
+            if level[t] < 0:
+                return total
+            it = [0] * len(self.head)
+            count = 0
+            while True:
+                f = self.augment(s, t, level, it)
+                if not f:
+                    break
+                total += f
+                count += 1
+                if count % 256 == 0:
+                    check(deadline)
+
+    def augment(self, s, t, level, it):
+        path = []
+        u = s
+        while u != t:
+            head = self.head[u]
+            while it[u] < len(head):
+                e = head[it[u]]
+                if self.cap[e] and level[self.to[e]] == level[u] + 1:
+                    break
+                it[u] += 1
+            else:
+                if u == s:
+                    return 0
+                level[u] = -1 # 死路
+                e = path.pop()
+                u = self.to[e ^ 1]
+                it[u] += 1
+                continue
+            path.append(e)
+            u = self.to[e]
+        f = min(self.cap[e] for e in path)
+        for e in path:
+            self.cap[e] -= f
+            self.cap[e ^ 1] += f
+        return f
+
+
+class Solver:
+    def __init__(self, first_half, second_half, staff_dic, time_budget=5, pins=None):
+        self.first_half = first_half
+        self.second_half = second_half
+        self.staff_dic = staff_dic
+        self.time_budget = time_budget
+        self.pins = pins or {}
+        self.arranger = Arranger(first_half, second_half, staff_dic, pins=self.pins) # 只有鎖定的格子
+        a = self.arranger
+        self.fixed = a.assigned > 0 # 鎖定的工作
+        self.capacity = np.maximum(a.limit - a.jobs, 0) # 扣掉鎖定後每人還能排的工作數
+        # 可以排入工作的 人員 x 時段，鎖定的格子不列入
+        self.eligible = (a.base == FREE) & ~self.fixed & (self.capacity > 0)[:, None]
+        self.optimal = False # 是否在時間內證明為最佳解
+        self.greedy = None # 作為起點的一般排班，空格原因以它的統計為準
+
+    def blocks(self):
+        """將每個半場的表演切成三場一組，組內每人最多兩份工作"""
+        a = self.arranger
+        result = []
+        for first, last in ((1, a.F), (a.F + 2, a.max_row - 1)):
+            for start in range(first, last + 1, 3):
+                result.append(list(range(start, min(start + 3, last + 1))))
+        return result
+
+    def relax(self, forbid, deadline=None):
+        """
+        放寬連續工作限制後以最大流排班
+        forbid: [set] 禁止的 (人員, row)
+        deadline: [float] 超過時丟出Timeout
+        回傳 (填入格數, 每個row的人員)
+        """
+        a = self.arranger
+        g = MaxFlow()
+        s, t = g.node(), g.node()
+        people = [g.node() for _ in a.names]
+        rows = [g.node() for _ in range(a.max_row)]
+        general = [g.node() for _ in range(a.max_row)] # 沒有火區許可的人只能填非火區的欄位
+        for r in range(a.max_row):
+            free = [c for c in range(COLS) if not a.arr[r][c]]
+            g.edge(rows[r], t, len(free))
+            g.edge(general[r], rows[r], len([c for c in free if c not in FIRE_COLS]))
+
+        def target(i, r):
+            return rows[r] if a.fire_ok[i] else general[r]
+
+        source = []
+        pairs = [] # (邊, 人員, row)
+        warm_rows = (0, a.F + 1)
+        block_list = self.blocks()
+        for i in range(len(a.names)):
+            check(deadline)
+            source.append(g.edge(s, people[i], 0))
+            ok = self.eligible[i]
+            for r in warm_rows:
+                if ok[r] and (i, r) not in forbid:
+                    pairs.append((g.edge(people[i], target(i, r), 1), i, r))
+            for block in block_list:
+                usable = [r for r in block if ok[r] and (i, r) not in forbid]
+                allowance = 2 - int(self.fixed[i, block].sum())
+                if not usable or allowance <= 0:
+                    continue
+                node = people[i]
+                if len(usable) > allowance:
+                    node = g.node()
+                    g.edge(people[i], node, allowance)
+                for r in usable:
+                    pairs.append((g.edge(node, target(i, r), 1), i, r))
+
+        # 逐步放寬每人的工作上限，讓工作平均分配
+        total = 0
+        for level in range(1, int(self.capacity.max(initial=0)) + 1):
+            check(deadline)
+            for i, e in enumerate(source):
+                if self.capacity[i] >= level:
+                    g.cap[e] += 1
+            total += g.run(s, t, deadline)
+        total += len(a.pinned)
+
+        chosen = [[] for _ in range(a.max_row)]
+        for e, i, r in pairs:
+            if g.flow(e):
+                chosen[r].append(i)
+        return total, chosen
+
+    def violation(self, chosen):
+        """
+        找出第一個連續工作三場的 (人員, [可以拿掉的row])
+        三場都是鎖定的工作時無法處理，略過
+        """
+        a = self.arranger
+        work = self.fixed.copy()
+        for r, people in enumerate(chosen):
+            work[people, r] = True
+        for first, last in ((1, a.F), (a.F + 2, a.max_row - 1)):
+            if last - first < 2:
+                continue
+            triple = work[:, first:last - 1] & work[:, first + 1:last] & work[:, first + 2:last + 1]
+            for i, k in np.argwhere(triple):
+                rows = [r for r in range(first + k, first + k + 3) if not self.fixed[i, r]]
+                if rows:
+                    return int(i), rows
+        return None
+
+    def layout(self, chosen):
+        """將每個row的人員排入欄位，火區欄位優先給有火區許可的人"""
+        a = self.arranger
+        arr = [list(row) for row in a.arr] # 從鎖定的格子開始
+        others = [c for c in range(COLS) if c not in FIRE_COLS]
+        for r, people in enumerate(chosen):
+            fire_cols = [c for c in FIRE_COLS if not arr[r][c]]
+            fire = [i for i in people if a.fire_ok[i]][:len(fire_cols)]
+            rest = [i for i in people if i not in fire]
+            for c, i in zip(fire_cols, fire):
+                arr[r][c] = a.names[i]
+            for c, i in zip([c for c in others + list(FIRE_COLS) if not arr[r][c]], rest):
+                arr[r][c] = a.names[i]
+        return arr
+
+    def repair(self, chosen):
+        """拿掉造成連續三場的工作，再用一般排班補空位，得到可行的細流"""
+        a = self.arranger
+        chosen = [list(p) for p in chosen]
+        for first, last in ((1, a.F), (a.F + 2, a.max_row - 1)):
+            run = np.zeros(len(a.names), dtype=np.int32)
+            for r in range(first, last + 1):
+                working = self.fixed[:, r].copy()
+                working[chosen[r]] = True
+                run = np.where(working, run + 1, 0)
+                for i in np.flatnonzero(run >= 3):
+                    for x in (r, r - 1, r - 2): # 拿掉最後三場中一個沒有鎖定的工作
+                        if i in chosen[x]:
+                            chosen[x].remove(i)
+                            run[i] = r - x
+                            break
+        filler = Arranger(self.first_half, self.second_half, self.staff_dic, self.layout(chosen), pins=self.pins)
+        filler.single_fill(list(range(1, a.F + 1)))
+        filler.single_fill(list(range(a.F + 2, a.max_row)))
+        filler.warm_up_fill(0)
+        filler.warm_up_fill(a.F + 1)
+        return filler.arr
+
+    def score(self, arr):
+        """(填入格數, -工作數平方和)，越大越好"""
+        counts = {}
+        for row in arr:
+            for name in row:
+                if name:
+                    counts[name] = counts.get(name, 0) + 1
+        return sum(counts.values()), -sum(c * c for c in counts.values())
+
+    def solve(self):
+        """在時間預算內回傳最佳的job_arr，以一般排班的結果為起點"""
+        deadline = time.perf_counter() + self.time_budget
+        self.greedy = Arranger(self.first_half, self.second_half, self.staff_dic, pins=self.pins)
+        best = self.greedy.generate()
+        best_score = self.score(best)
+        if best_score[0] == self.arranger.max_row * COLS: # 已經全部填滿
+            self.optimal = True
+            return best
+        stack = [frozenset()]
+        while stack:
+            forbid = stack.pop()
+            try:
+                bound, chosen = self.relax(forbid, deadline)
+            except Timeout: # 時間到，回傳目前最好的細流
+                return best
+            if bound <= best_score[0]:
+                continue
+            found = self.violation(chosen)
+            if found is None:
+                candidate = self.layout(chosen)
+            else:
+                candidate = self.repair(chosen)
+            score = self.score(candidate)
+            if score > best_score:
+                best, best_score = candidate, score
+            if found is not None and bound > best_score[0]:
+                i, rows = found
+                for r in reversed(rows):
+                    stack.append(forbid | {(i, r)})
+        self.optimal = True
+        return best
@@ -2,7 +2,7 @@ from PyQt5.QtWidgets import (QTableWidget, QWidget, QVBoxLayout, QHBoxLayout, QL
                             QDialog, QFormLayout, QLineEdit, QDialogButtonBox, QMessageBox,
                             QTableWidgetItem, QMenu, QAction)
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QColor
+from Highlight import Highlight
 
 class CustomTable(QTableWidget):
     def __init__(self, parent, controller, row, col):
@@ -44,7 +44,10 @@ class CustomTable(QTableWidget):
             for row in sorted(selected_rows, reverse=True):
                 name = self.item(row, 0).text()
                 staff_dic.pop(name)
+                self.controller.record_staff(name)
                 self.removeRow(row)
+            self.parent().indexRows()
+            self.controller.invalidate()
         except Exception as e:
             print('StaffTable.py: deleteSelectedRows', e)
 
@@ -63,7 +66,8 @@ class StaffTable(QWidget):
             self.table.setColumnHidden(6, True)
             self.table.cellClicked.connect(self.clicked)
             self.table.cellChanged.connect(self.changed)
-            self.highlighted = []
+            self.table.model().layoutChanged.connect(self.indexRows) # 排序後row會改變
+            self.highlight = Highlight(self.table)
 
             # Title & Button
             title = QLabel("工作人員")
@@ -163,10 +167,13 @@ class StaffTable(QWidget):
             if name in staff_dic:
                 return
             num = int(self.table.item(row, 6).text())
-            for old_name, dic in staff_dic.items():
-                if dic['num'] == num:
-                    staff_dic[name] = staff_dic.pop(old_name)
-                    break
+            old_name = self.controller.staff_num[num]
+            staff_dic[name] = staff_dic.pop(old_name)
+            self.controller.staff_num[num] = name
+            self.controller.staff_row.pop(old_name, None)
+            self.controller.staff_row[name] = row
+            self.controller.record('rename_staff', old=old_name, new=name)
+            self.controller.invalidate()
         except Exception as e:
             print("StaffTable.py: changed", e)
 
@@ -184,13 +191,8 @@ class StaffTable(QWidget):
 
     def highlightStaff(self, name):
         try:
-            self.systemChange = True
-            for row in range(self.table.rowCount()):
-                if self.table.item(row, 0).text() == name:
-                    self.table.item(row, 0).setBackground(QColor("#ffffaa"))
-                    self.highlighted.append((row, 0))
-                    break
-            self.systemChange = False
+            if name in self.controller.staff_row:
+                self.highlight.paint({(self.controller.staff_row[name], 0): "#ffffaa"})
 
         except Exception as e:
             print('StaffTable.py: highlightStaff', e)
@@ -201,50 +203,39 @@ class StaffTable(QWidget):
         空閒-綠色，準備二-淡紅色，準備一&表演者-紅色，剛下場-橘色
         """
         try:
-            self.systemChange = True
-            staff_dic = self.controller.staff_dic
             fh = self.controller.first_half
-            sh = self.controller.second_half
-            a = 'available_f'
-            idx = row
             if row == len(fh)+1:
                 return
-            if row > len(fh)+1:
-                a = 'available_s'
-                idx -= len(fh)+2
-            for r in range(self.table.rowCount()):
-                staff_name = self.table.item(r, 0).text()
-                if 'available_f' not in staff_dic[staff_name] or 'available_s' not in staff_dic[staff_name]:
-                    continue
-                if staff_dic[staff_name][a][idx] == 10: # 將可用人員變為綠色
-                    self.table.item(r, 0).setBackground(QColor("#53ff53"))
-                    self.highlighted.append((r, 0))
-                elif staff_dic[staff_name][a][idx] == 7: # 將 表演下一隻 變為橘色
-                    self.table.item(r, 0).setBackground(QColor("#ffaf60"))
-                    self.highlighted.append((r, 0))
-                elif staff_dic[staff_name][a][idx] == 3: # 將 準備12 變為淡紅色
-                    self.table.item(r, 0).setBackground(QColor("#ff7575"))
-                    self.highlighted.append((r, 0))
-                elif staff_dic[staff_name][a][idx] == 1: # 將 工作人員 變為黃色
-                    self.table.item(r, 0).setBackground(QColor("#ffffaa"))
-                    self.highlighted.append((r, 0))
-                elif staff_dic[staff_name][a][idx] == 0: # 將 表演者 變為紅色
-                    self.table.item(r, 0).setBackground(QColor("#ff0000"))
-                    self.highlighted.append((r, 0))
-            self.systemChange = False
+            arr_row = row if row <= len(fh) else row-1
+            arranger = self.controller.get_arranger()
+            if arr_row >= arranger.max_row:
+                return
+            avail = arranger.avail[:, arr_row].tolist()
+            # 10: 可用人員-綠色，7: 表演下一隻-橘色，3: 準備12-淡紅色，1: 工作人員-黃色，0: 表演者-紅色
+            colors = {10: "#53ff53", 7: "#ffaf60", 3: "#ff7575", 1: "#ffffaa", 0: "#ff0000"}
+            cells = {}
+            for staff_name, r in self.controller.staff_row.items():
+                if staff_name in arranger.index:
+                    cells[(r, 0)] = colors[avail[arranger.index[staff_name]]]
+            self.highlight.paint(cells)
         except Exception as e:
             print('StaffTable.py: highlightPerformance', e)
 
     def clearHighlight(self):
         """清除所有高亮的儲存格"""
         try:
-            self.systemChange = True
-            for coor in self.highlighted:
-                self.table.item(coor[0], coor[1]).setBackground(QColor('white'))
-            self.systemChange = False
+            self.highlight.clear()
         except Exception as e:
             print('StaffTable.py: clearHighlight', e)
 
+    def indexRows(self):
+        """重建工作人員名字及編號的索引，表格重新整理、排序或刪除列後呼叫"""
+        try:
+            self.controller.staff_row = {self.table.item(row, 0).text(): row for row in range(self.table.rowCount())}
+            self.controller.staff_num = {dic['num']: name for name, dic in self.controller.staff_dic.items()}
+        except Exception as e:
+            print('StaffTable.py: indexRows', e)
+
     def changePrio(self, prio):
         """將選取的row中所有人員的優先度都改為prio"""
         try:
@@ -253,7 +244,9 @@ class StaffTable(QWidget):
                 row = index.row()
                 name = self.table.item(row, 0).text()
                 self.controller.staff_dic[name]['priority'] = prio
-            self.update()
+                self.controller.record_staff(name)
+            self.controller.invalidate()
+            self.controller.schedule(self)
             self.systemChange = False
         except Exception as e:
             print('StaffTable.py: changePrio', e)
@@ -266,7 +259,9 @@ class StaffTable(QWidget):
                 row = index.row()
                 name = self.table.item(row, 0).text()
                 self.controller.staff_dic[name]['extinguish'] = permission
-            self.update()
+                self.controller.record_staff(name)
+            self.controller.invalidate()
+            self.controller.schedule(self)
             self.systemChange = False
         except Exception as e:
             print('StaffTable.py: changeExtinguish', e)
@@ -280,7 +275,9 @@ class StaffTable(QWidget):
                 dic = self.controller.staff_dic
                 dic[name] = {"jobs": 0, "priority": '中', "performances": [], "assistances": [], 'extinguish': '可', 'num': self.controller.unique_id}
                 self.controller.unique_id += 1
-                self.update()
+                self.controller.record_staff(name)
+                self.controller.invalidate()
+                self.controller.schedule(self)
         except Exception as e:
             print('StaffTable.py: addStaff', e)
 
@@ -302,7 +299,9 @@ class StaffTable(QWidget):
                         dic[name]['performances'].append(p_name)
                     elif type == 'assistant':
                         dic[name]['assistances'].append(p_name)
-            self.update()
+                    self.controller.record_staff(name)
+            self.controller.invalidate()
+            self.controller.schedule(self)
         except Exception as e:
             print('StaffTable.py: addStaffList', e)
 
@@ -324,16 +323,37 @@ class StaffTable(QWidget):
                         dic[name]['assistances'].remove(p_name)
                 if not dic[name]['performances'] and not dic[name]['assistances']:
                     dic.pop(name)
-            self.update()
+                self.controller.record_staff(name)
+            self.controller.invalidate()
+            self.controller.schedule(self)
         except Exception as e:
             print('StaffTable.py: removeStaffList', e)
 
+    def refresh(self, names):
+        """
+        由controller的排程呼叫
+        names: [set] 工作數量改變的人員，只更新這些人的工作數量；None時整個表格重新整理
+        """
+        try:
+            if names is None:
+                self.update()
+                return
+            self.systemChange = True
+            for name in names:
+                if name in self.controller.staff_row and name in self.controller.staff_dic:
+                    self.table.item(self.controller.staff_row[name], 1).setText(str(self.controller.staff_dic[name]['jobs']))
+            self.systemChange = False
+        except Exception as e:
+            self.systemChange = False
+            print('StaffTable.py: refresh', e)
+
     def update(self):
         """根據controller.staff_dic中的資料重新整理table"""
         try:
             self.systemChange = True
             self.table.setSortingEnabled(False)
             self.table.setRowCount(0)
+            self.highlight.reset()
             row = 0
             for name, dic in self.controller.staff_dic.items():
                 self.table.insertRow(row)
@@ -349,6 +369,7 @@ class StaffTable(QWidget):
                     item.setFlags(item.flags() & ~Qt.ItemIsEditable)
                 row = row + 1
             self.table.setSortingEnabled(True)
+            self.indexRows()
             self.systemChange = False
         except Exception as e:
             print("StaffTable.py: update", e)
@@ -0,0 +1,118 @@
+"""
+效能統計
+預設關閉，開啟後記錄各項操作的次數及耗時，並寫入stats.log (超過1MB時換新檔，保留3個舊檔)
+可以指定對下一次的某項操作做cProfile，結果存成.prof檔並把最耗時的函式寫進log
+關閉時timer只多一次判斷，不影響效能
+"""
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import time
+from logging.handlers import RotatingFileHandler
+
+LOG_PATH = 'stats.log'
+LOG_SIZE = 1024 * 1024
+LOG_BACKUPS = 3
+
+enabled = False
+timings = {} # 操作名稱 -> [次數, 總毫秒, 最大毫秒]
+counters = {} # 計數名稱 -> 數量
+armed = None # 下一次要做cProfile的操作名稱
+logger = logging.getLogger('FlowArranger.stats')
+logger.propagate = False
+
+
+def enable(on=True):
+    """開啟或關閉統計，第一次開啟時建立log檔"""
+    global enabled
+    if on and not logger.handlers:
+        handler = RotatingFileHandler(LOG_PATH, maxBytes=LOG_SIZE, backupCount=LOG_BACKUPS, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    enabled = on
+
+
+def reset():
+    """清除目前的統計"""
+    timings.clear()
+    counters.clear()
+
+
+def count(name, n=1):
+    if enabled:
+        counters[name] = counters.get(name, 0) + n
+
+
+def profile(name):
+    """下一次執行name時做cProfile"""
+    global armed
+    armed = name
+
+
+class timer:
+    """
+    記錄一段程式的耗時
+    with Stats.timer('generate.arrange'):
+        ...
+    """
+    __slots__ = ('name', 'start', 'profiler')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+        self.profiler = None
+
+    def __enter__(self):
+        global armed
+        if enabled:
+            if armed == self.name:
+                armed = None
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is None:
+            return False
+        ms = (time.perf_counter() - self.start) * 1000
+        if self.profiler is not None:
+            self.profiler.disable()
+            save_profile(self.name, self.profiler)
+        record = timings.setdefault(self.name, [0, 0.0, 0.0])
+        record[0] += 1
+        record[1] += ms
+        record[2] = max(record[2], ms)
+        logger.info('%s %.2f ms', self.name, ms)
+        return False
+
+
+def timed(name):
+    """記錄整個函式耗時的decorator"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def save_profile(name, profiler):
+    """將cProfile結果存成 profile_操作名稱_時間.prof，並把最耗時的20個函式寫進log"""
+    file_path = f"profile_{name}_{time.strftime('%Y%m%d_%H%M%S')}.prof"
+    profiler.dump_stats(file_path)
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(20)
+    logger.info('profile %s -> %s\n%s', name, file_path, text.getvalue())
+
+
+def summary():
+    """回傳 [(名稱, 次數, 總毫秒, 平均毫秒, 最大毫秒)]，依總耗時排序"""
+    rows = [(name, n, total, total / n, peak) for name, (n, total, peak) in timings.items()]
+    return sorted(rows, key=lambda row: -row[2])
@@ -0,0 +1,100 @@
+from PyQt5.QtWidgets import (QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+                            QPushButton, QComboBox, QLabel, QHeaderView)
+from PyQt5.QtCore import Qt, QTimer
+import Stats
+
+# 可以做cProfile的操作，其他執行過的操作也會出現在選單中
+OPERATIONS = ['generate', 'generate.pair_fill', 'generate.single_fill', 'generate.warm_up_fill', 'check', 'load', 'load.read', 'save', 'auto_save', 'highlight',
+              'refresh.FlowTable', 'refresh.StaffTable', 'refresh.PerformanceTable']
+
+
+class StatsPanel(QDockWidget):
+    """
+    效能統計面板，顯示時開啟統計，關閉時停止
+    每秒更新一次各項操作的次數及耗時
+    """
+    def __init__(self, parent=None):
+        try:
+            super().__init__("效能統計", parent)
+            self.setObjectName('stats_panel')
+
+            self.table = QTableWidget(0, 5)
+            self.table.setHorizontalHeaderLabels(['操作', '次數', '總共(ms)', '平均(ms)', '最大(ms)'])
+            self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+            self.table.verticalHeader().setVisible(False)
+            self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+            self.counters = QLabel()
+            self.counters.setWordWrap(True)
+
+            clear_button = QPushButton("清除")
+            clear_button.clicked.connect(self.clear)
+            self.operation = QComboBox()
+            self.operation.addItems(OPERATIONS)
+            profile_button = QPushButton("分析下一次")
+            profile_button.setToolTip("對下一次選取的操作做cProfile，結果存成.prof檔並寫入stats.log")
+            profile_button.clicked.connect(self.profile)
+            self.status = QLabel()
+
+            button_layout = QHBoxLayout()
+            button_layout.addWidget(clear_button)
+            button_layout.addWidget(self.operation)
+            button_layout.addWidget(profile_button)
+
+            layout = QVBoxLayout()
+            layout.addLayout(button_layout)
+            layout.addWidget(self.status)
+            layout.addWidget(self.table)
+            layout.addWidget(self.counters)
+            widget = QWidget()
+            widget.setLayout(layout)
+            self.setWidget(widget)
+
+            self.timer = QTimer(self)
+            self.timer.timeout.connect(self.update)
+            self.visibilityChanged.connect(self.toggled)
+        except Exception as e:
+            print('StatsPanel.py: __init__', e)
+
+    def toggled(self, visible):
+        try:
+            Stats.enable(visible)
+            if visible:
+                self.update()
+                self.timer.start(1000)
+            else:
+                self.timer.stop()
+        except Exception as e:
+            print('StatsPanel.py: toggled', e)
+
+    def update(self):
+        """根據Stats中的資料重新整理table"""
+        try:
+            rows = Stats.summary()
+            self.table.setRowCount(len(rows))
+            for row, (name, n, total, avg, peak) in enumerate(rows):
+                values = [name, str(n), f"{total:.1f}", f"{avg:.2f}", f"{peak:.1f}"]
+                for col, text in enumerate(values):
+                    item = QTableWidgetItem(text)
+                    if col:
+                        item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                    self.table.setItem(row, col, item)
+                if self.operation.findText(name) < 0:
+                    self.operation.addItem(name)
+            self.counters.setText('　'.join(f"{name}: {n}" for name, n in sorted(Stats.counters.items())))
+            self.status.setText(f"等待分析: {Stats.armed}" if Stats.armed else '')
+        except Exception as e:
+            print('StatsPanel.py: update', e)
+
+    def clear(self):
+        try:
+            Stats.reset()
+            self.update()
+        except Exception as e:
+            print('StatsPanel.py: clear', e)
+
+    def profile(self):
+        try:
+            Stats.profile(self.operation.currentText())
+            self.update()
+        except Exception as e:
+            print('StatsPanel.py: profile', e)
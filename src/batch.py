@@ -0,0 +1,86 @@
+"""
+批次處理
+對資料夾或萬用字元指定的多個json存檔，以多個行程平行生成細流、自動檢查並輸出
+每完成一個檔案就把結果寫進摘要CSV
+用法: python src/batch.py shows/ "rehearsal_*.json" [--mode optimize] [--output-dir out] [--summary summary.csv]
+"""
+import argparse
+import csv
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Arranger import REJECTIONS
+from cli import run, add_options
+
+FIELDS = ['file', 'status', 'performances', 'staff', 'empty', 'conflicts', 'penalty', 'seconds', 'optimal', 'output', 'xlsx'] + \
+    REJECTIONS + ['error']
+
+
+def find_files(paths):
+    """展開資料夾 (其中的*.json) 及萬用字元，依路徑排序並去除重複"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += glob.glob(os.path.join(path, '*.json'))
+        else:
+            files += glob.glob(path, recursive=True)
+    return sorted(set(files))
+
+
+def process(file_path, output_dir, no_xlsx, options):
+    """在子行程中處理一個存檔，錯誤不會中斷其他檔案"""
+    try:
+        output = os.path.join(output_dir, os.path.basename(file_path)) if output_dir else None
+        result = run(file_path, output, '' if no_xlsx else None, workers=1, **options)
+        result.update(result.pop('rejected'))
+        result.pop('problems')
+        result['status'] = 'ok' if not result['conflicts'] else 'conflict'
+        return result
+    except Exception as e:
+        return {'file': file_path, 'status': 'error', 'error': f'{type(e).__name__}: {e}'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批次生成細流，結果寫入摘要CSV')
+    parser.add_argument('paths', nargs='+', help='存檔所在的資料夾或萬用字元')
+    parser.add_argument('--output-dir', help='json及Excel的輸出資料夾，預設覆蓋原檔')
+    parser.add_argument('--no-xlsx', action='store_true', help='不輸出Excel')
+    parser.add_argument('--summary', default='batch_summary.csv', help='摘要CSV的路徑')
+    parser.add_argument('--workers', type=int, default=None, help='同時處理的檔案數，預設為CPU核心數')
+    add_options(parser)
+    args = parser.parse_args()
+
+    files = find_files(args.paths)
+    if not files:
+        print('找不到任何存檔')
+        sys.exit(1)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    options = {'mode': args.mode, 'time_budget': args.time_budget, 'restarts': args.restarts,
+               'improve': args.improve, 'seed': args.seed}
+    workers = min(args.workers or os.cpu_count() or 1, len(files))
+
+    failed = 0
+    # utf-8-sig讓Excel能正確顯示中文
+    with open(args.summary, 'w', newline='', encoding='utf-8-sig') as f, ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        f.flush()
+        futures = [pool.submit(process, path, args.output_dir, args.no_xlsx, options) for path in files]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            writer.writerow(result)
+            f.flush()
+            if result['status'] == 'error':
+                failed += 1
+                print(f"[{done}/{len(files)}] {result['file']}: {result['error']}")
+            else:
+                print(f"[{done}/{len(files)}] {result['file']}: 空格 {result['empty']}，衝突 {result['conflicts']}，{result['seconds']} 秒")
+    print(f"摘要已存到 {args.summary}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
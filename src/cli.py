@@ -0,0 +1,104 @@
+"""
+命令列模式，不開啟視窗
+讀取json存檔，生成細流並自動檢查，再寫回json及輸出Excel
+用法: python src/cli.py save_file.json [--mode optimize] [--time-budget 10] [--seed 1] [--xlsx output.xlsx]
+"""
+import argparse
+import os
+import sys
+import time
+from Exporter import write_xlsx
+from Generator import arrange, problems
+from SaveFile import read_json, write_json, dump
+
+# 命令列的模式名稱 -> 細流區的模式
+MODES = {'quick': '快速', 'optimize': '最佳化', 'random': '多次隨機', 'repair': '局部重排'}
+
+
+def run(file_path, output=None, xlsx=None, mode='quick', time_budget=5, restarts=64, improve=False, seed=None,
+        workers=None):
+    """
+    處理一個存檔，回傳結果摘要 (dict)，給命令列及批次處理使用
+    output: [str] 寫回的json路徑，None時覆蓋原檔
+    xlsx: [str] Excel路徑，None時與json同名，空字串時不輸出
+    workers: [int] 多次隨機使用的行程數，None時使用所有核心
+    """
+    start = time.perf_counter()
+    data = read_json(file_path)
+    first_half, second_half, staff_dic = data['first_half'], data['second_half'], data['staff_dic']
+    arranger, rejections = arrange(first_half, second_half, staff_dic, MODES[mode], data['job_arr'], data['pinned'],
+                                   time_budget=time_budget, restarts=restarts, improve=improve, seed=seed,
+                                   workers=workers)
+    lists = problems(arranger)
+
+    output = output or file_path
+    write_json(output, dump(first_half, second_half, staff_dic, arranger.arr, arranger.pinned, data['unique_id']), indent=4)
+    if xlsx is None:
+        xlsx = os.path.splitext(output)[0] + '.xlsx'
+    if xlsx:
+        write_xlsx(xlsx, first_half, second_half, arranger.arr)
+
+    cells = [name for row in arranger.arr for name in row]
+    return {
+        'file': file_path,
+        'output': output,
+        'xlsx': xlsx,
+        'performances': len(first_half) + len(second_half),
+        'staff': len(staff_dic),
+        'empty': sum(1 for name in cells if not name),
+        'penalty': int(arranger.penalty()),
+        'conflicts': sum(len(names) for names in lists.values()),
+        'problems': {c: names for c, names in lists.items() if names},
+        'optimal': arranger.optimal,
+        'rejected': {rule: sum(entry['rejected'][rule] for entry in rejections) for rule in rejections[0]['rejected']}
+                    if rejections else {},
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def parser():
+    parser = argparse.ArgumentParser(description='不開啟視窗，生成細流並輸出')
+    parser.add_argument('file', help='json存檔')
+    parser.add_argument('-o', '--output', help='寫回的json路徑，預設覆蓋原檔')
+    parser.add_argument('--xlsx', help='Excel路徑，預設與json同名')
+    parser.add_argument('--no-xlsx', action='store_true', help='不輸出Excel')
+    add_options(parser)
+    parser.add_argument('--strict', action='store_true', help='自動檢查有衝突時回傳錯誤碼2')
+    return parser
+
+
+def positive(type):
+    """argparse的type，只接受大於0的數字，與細流區的設定範圍一致"""
+    def convert(text):
+        value = type(text)
+        if value <= 0:
+            raise argparse.ArgumentTypeError(f'需大於0: {text}')
+        return value
+    return convert
+
+
+def add_options(parser):
+    """生成細流的選項，批次處理共用"""
+    parser.add_argument('--mode', choices=list(MODES), default='quick',
+                        help='quick: 快速，optimize: 最佳化，random: 多次隨機，repair: 局部重排')
+    parser.add_argument('--time-budget', type=positive(float), default=5, help='最佳化及局部優化的時間上限 (秒)')
+    parser.add_argument('--restarts', type=positive(int), default=64, help='多次隨機的排班次數')
+    parser.add_argument('--improve', action='store_true', help='生成後做局部優化')
+    parser.add_argument('--seed', type=int, default=None, help='隨機種子，同樣的種子產生同樣的細流')
+
+
+def main():
+    args = parser().parse_args()
+    result = run(args.file, args.output, '' if args.no_xlsx else args.xlsx, args.mode, args.time_budget,
+                 args.restarts, args.improve, args.seed)
+    print(f"{result['file']}: 空格 {result['empty']}，衝突 {result['conflicts']}，扣分 {result['penalty']}，{result['seconds']} 秒")
+    if result['optimal'] is not None:
+        print('  已證明最佳' if result['optimal'] else '  時間到，使用目前找到最好的細流')
+    for c, names in result['problems'].items():
+        print(f"  {c}: {', '.join(names)}")
+    if args.strict and result['conflicts']:
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
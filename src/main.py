@@ -1,6 +1,7 @@
+import os
 import sys
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QAction, QVBoxLayout, QWidget, QSplitter)
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from Controller import Controller
 from StaffTable import StaffTable
 from FlowTable import FlowTable
@@ -30,6 +31,12 @@ class MainWindow(QMainWindow):
             file_menu.addAction(save_action)
             file_menu.addAction(save_as_action)
             file_menu.addAction(read_action)
+            tool_menu = menubar.addMenu("工具")
+            self.stats_action = QAction("效能統計", self)
+            self.stats_action.setCheckable(True)
+            self.stats_action.toggled.connect(self.showStats)
+            tool_menu.addAction(self.stats_action)
+            self.stats_panel = None # 第一次開啟時才建立
 
             # Central Widget
             central_widget = QWidget()
@@ -62,9 +69,37 @@ class MainWindow(QMainWindow):
         except Exception as e:
             print('main.py: initUI', e)
 
+    def showStats(self, checked):
+        """顯示或隱藏效能統計面板，面板顯示時才記錄統計"""
+        try:
+            if self.stats_panel is None:
+                from StatsPanel import StatsPanel
+                self.stats_panel = StatsPanel(self)
+                self.addDockWidget(Qt.BottomDockWidgetArea, self.stats_panel)
+                self.stats_panel.visibilityChanged.connect(self.stats_action.setChecked)
+            self.stats_panel.setVisible(checked)
+        except Exception as e:
+            print('main.py: showStats', e)
+
+    def closeEvent(self, event):
+        self.middle_table.wait()
+        self.controller.close()
+        super().closeEvent(event)
+
+def launch():
+    """顯示主視窗，自動存檔、復原等功能等畫面出現後才初始化"""
+    window = MainWindow()
+    window.show()
+    QTimer.singleShot(0, window.controller.start)
+    if os.environ.get('FLOWARRANGER_STATS'): # 設定此環境變數時一開始就記錄效能統計
+        window.stats_action.setChecked(True)
+    return window
+
 if __name__ == "__main__":
+    if getattr(sys, 'frozen', False): # 打包成執行檔時，多次隨機的子行程才不會重新開啟程式
+        import multiprocessing # 只有打包後需要，一般執行時不拖慢啟動
+        multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     # apply_stylesheet(app, theme='dark_blue.xml', invert_secondary=True)
-    window = MainWindow()
-    window.show()
+    window = launch()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,47 @@
+"""
+排班引擎的測試
+用法: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from Arranger import Arranger, REJECTIONS  # noqa: E402
+
+FIRE = REJECTIONS.index('火區許可')
+
+
+def make_arranger(extinguish):
+    """一個表演，extinguish: {名字: '可'/'不可'}，這些人都沒有表演，預熱時段都有空"""
+    staff_dic = {'表演者': {'priority': '中', 'performances': ['表演'], 'assistances': [], 'extinguish': '可', 'num': 0}}
+    for k, (name, ok) in enumerate(extinguish.items(), 1):
+        staff_dic[name] = {'priority': '中', 'performances': [], 'assistances': [], 'extinguish': ok, 'num': k}
+    first_half = {'表演': {'performers': ['表演者'], 'assistants': [], 'time': 5}}
+    return Arranger(first_half, {}, staff_dic)
+
+
+class TestFireRejections(unittest.TestCase):
+    def test_uncertified_placed_in_next_column_is_not_rejected(self):
+        """沒有火區許可的人在第6欄被跳過，接著排進第7欄，不算被刷掉"""
+        names = [f'人員{k}' for k in range(10)]
+        a = make_arranger({name: '不可' if name == '人員6' else '可' for name in names})
+        a.fill([0], iter(a.index[name] for name in names))
+        self.assertEqual(a.arr[0][7], '人員6')
+        self.assertTrue(all(a.arr[0]))
+        self.assertEqual(a.rejects[0][FIRE], 0)
+
+    def test_uncertified_left_over_with_empty_fire_column(self):
+        """火區留空時，沒排入的人算作被火區許可刷掉"""
+        names = [f'人員{k}' for k in range(10)]
+        a = make_arranger({name: '可' if k < 6 else '不可' for k, name in enumerate(names)})
+        a.fill([0], iter(a.index[name] for name in names))
+        self.assertEqual(a.arr[0][6], '')
+        self.assertEqual(a.arr[0][8], '')
+        pending = sum(1 for name in names[6:] if name not in a.arr[0])
+        self.assertGreater(pending, 0)
+        self.assertEqual(a.rejects[0][FIRE], pending)
+
+
+if __name__ == '__main__':
+    unittest.main()